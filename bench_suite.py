@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import platform  # noqa: E402
+import shutil  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for project in ["proj1", "proj2", "proj3"]:
+    sys.path.append(os.path.join(ROOT, project))
+
+from download import DataDownloader  # noqa: E402
+from columnar import save_columns  # noqa: E402
+from synthetic import generate  # noqa: E402
+from get_stat import stat_tables  # noqa: E402
+from analysis import get_dataframe, load_dataframe, roadtype_table, animals_table, conditions_table  # noqa: E402
+from cube import MonthlyCube  # noqa: E402
+from doc import preprocessing  # noqa: E402
+
+DOC_COLUMNS = ["p1", "p12", "p13a", "p36", "region"]
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def remove_caches(folder):
+    # everything except downloaded ZIP files
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif not name.endswith(".zip"):
+            os.remove(path)
+
+
+def build_caches(context):
+    # warm stage reads caches, they are made by one get_dict when no earlier stage made them
+    downloader = DataDownloader(folder=context["folder"])
+
+    if not all(os.path.exists(downloader._cache_path(region)) for region in downloader.regions):
+        downloader.get_dict()
+
+
+def stage_parse(context):
+    data = DataDownloader(folder=context["folder"]).parse_regions_data(list(DataDownloader.regions))
+    rows = sum(len(region["p1"]) for region in data.values())
+
+    return rows, rows
+
+
+def stage_get_dict_cold(context):
+    data = DataDownloader(folder=context["folder"]).get_dict()
+
+    return len(data["p1"]), len(data["p1"])
+
+
+def stage_get_dict_warm(context):
+    data = DataDownloader(folder=context["folder"]).get_dict()
+    context["data"] = data
+
+    return len(data["p1"]), len(data["p1"])
+
+
+def stage_get_dataframe(context):
+    df = get_dataframe(context["store"])
+
+    return len(df), len(df)
+
+
+def stage_load_dataframe(context):
+    df = load_dataframe(context["data"])
+    context["df"] = df
+
+    return len(df), len(df)
+
+
+def stage_stat(context):
+    regions, absolute, _ = stat_tables(context["data"])
+
+    return len(context["data"]["p1"]), int(absolute.sum())
+
+
+def stage_cube(context):
+    cube = MonthlyCube.build(context["df"])
+    tables = [roadtype_table(cube), animals_table(cube), conditions_table(cube)]
+
+    return len(context["df"]), [len(table) for table in tables]
+
+
+def stage_preprocessing(context):
+    df = pd.DataFrame({col: np.asarray(context["data"][col]) for col in DOC_COLUMNS})
+    mortality_reg, _, _ = preprocessing(df)
+
+    return len(df), int(mortality_reg["p13a"].sum())
+
+
+# name: (function, preparation before every run, which is not measured)
+STAGES = {
+    "parse": (stage_parse, lambda context: None),
+    "get_dict_cold": (stage_get_dict_cold, lambda context: remove_caches(context["folder"])),
+    "get_dict_warm": (stage_get_dict_warm, build_caches),
+    "get_dataframe": (stage_get_dataframe, lambda context: None),
+    "load_dataframe": (stage_load_dataframe, lambda context: None),
+    "stat": (stage_stat, lambda context: None),
+    "cube": (stage_cube, lambda context: None),
+    "preprocessing": (stage_preprocessing, lambda context: None),
+}
+
+
+def run_stage(name, context, repeat):
+    function, prepare = STAGES[name]
+
+    best = None
+    for _ in range(repeat):
+        prepare(context)
+
+        start = time.perf_counter()
+        rows, result = function(context)
+        duration = time.perf_counter() - start
+
+        best = duration if best is None else min(best, duration)
+
+    # peak memory is measured in separate run, tracing slows down the measured one
+    prepare(context)
+    tracemalloc.start()
+    try:
+        function(context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"time": best, "rows": rows, "rows_per_s": rows / best if best else None,
+            "peak_mb": peak / 1048576, "result": result}
+
+
+def run_size(rows, years, stages, repeat, seed):
+    folder = tempfile.mkdtemp(prefix="izv_bench_")
+
+    try:
+        start = time.perf_counter()
+        generate(folder, rows, years, seed=seed)
+        results = {"generate": {"time": time.perf_counter() - start, "bytes": folder_size(folder)}}
+
+        context = {"folder": folder}
+
+        for name in stages:
+            # later stages need data of earlier ones
+            if name in ("get_dataframe", "load_dataframe", "stat", "cube", "preprocessing") and "data" not in context:
+                context["data"] = DataDownloader(folder=folder).get_dict()
+            if name == "get_dataframe" and "store" not in context:
+                context["store"] = os.path.join(folder, "store")
+                save_columns(context["store"], context["data"])
+            if name == "cube" and "df" not in context:
+                context["df"] = load_dataframe(context["data"])
+
+            results[name] = run_stage(name, context, repeat)
+    finally:
+        shutil.rmtree(folder)
+
+    return results
+
+
+def print_results(results, previous=None):
+    print("{:>10}  {:<16}{:>10}{:>12}{:>12}  {:<16}{:>8}".format("rows", "stage", "time [s]", "rows/s",
+                                                                "peak [MB]", "result", "change"))
+
+    for size, stages in results["sizes"].items():
+        for name, result in stages.items():
+            if name == "generate":
+                continue
+
+            change = ""
+            if previous is not None and name in previous["sizes"].get(size, {}):
+                change = "{:+.0f} %".format((result["time"] / previous["sizes"][size][name]["time"] - 1) * 100)
+
+            print("{:>10}  {:<16}{:>10.3f}{:>12.0f}{:>12.1f}  {:<16}{:>8}".format(
+                size, name, result["time"], result["rows_per_s"], result["peak_mb"], str(result["result"])[:16],
+                change))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark of ingest and aggregations on synthetic data")
+
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                            help="Rows per region and year of synthetic data")
+    arg_parser.add_argument("--years", type=int, nargs="+", default=[2016, 2017, 2018, 2019, 2020])
+    arg_parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    arg_parser.add_argument("--repeat", type=int, default=1, help="Number of repetitions, best time is reported")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", help="JSON file for results")
+    arg_parser.add_argument("--compare", help="JSON file with results of previous run")
+
+    args = arg_parser.parse_args()
+
+    results = {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+               "time": time.strftime("%Y-%m-%d %H:%M:%S"), "years": args.years, "sizes": dict()}
+
+    for size in args.sizes:
+        # keys are strings, so results are the same after loading from JSON
+        results["sizes"][str(size)] = run_size(size, args.years, args.stages, args.repeat, args.seed)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import argparse
+import gzip
+import os
+import pickle
+import shutil
+import time
+import tracemalloc
+
+from download import DataDownloader
+from compact import print_memory_report
+from codec import available_codecs
+from columnar import save_columns, load_columns
+
+
+def same_columns(first, second):
+    if list(first.keys()) != list(second.keys()):
+        return False
+
+    for key in first:
+        if first[key].dtype != second[key].dtype or not np.array_equal(first[key], second[key]):
+            return False
+
+    return True
+
+
+def timed(function, *args, repeat=1):
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+
+        if best is None or duration < best:
+            best = duration
+
+    return best, result
+
+
+def bench_parse(folder, regions, repeat=1):
+    rows_parser = DataDownloader(folder=folder, engine="rows")
+    columns_parser = DataDownloader(folder=folder, engine="columns")
+
+    print("{:<8}{:>10}{:>12}{:>12}{:>10}".format("region", "rows", "rows [s]", "columns [s]", "speedup"))
+
+    for region in regions:
+        rows_time, rows_data = timed(rows_parser.parse_region_data, region, repeat=repeat)
+        columns_time, columns_data = timed(columns_parser.parse_region_data, region, repeat=repeat)
+
+        if not same_columns(rows_data, columns_data):
+            raise AssertionError("parsers differ for region " + region)
+
+        print("{:<8}{:>10}{:>12.3f}{:>12.3f}{:>9.1f}x".format(region, len(rows_data["p1"]), rows_time,
+                                                               columns_time, rows_time / columns_time))
+
+
+def bench_batch(folder, regions, repeat=1):
+    downloader = DataDownloader(folder=folder)
+
+    single_time, single_data = timed(lambda: {region: downloader.parse_region_data(region) for region in regions},
+                                     repeat=repeat)
+    batch_time, batch_data = timed(downloader.parse_regions_data, regions, repeat=repeat)
+
+    for region in regions:
+        if not same_columns(single_data[region], batch_data[region]):
+            raise AssertionError("batch parser differs for region " + region)
+
+    print("{:<10}{:>10}{:>12}".format("mode", "regions", "time [s]"))
+    print("{:<10}{:>10}{:>12.3f}".format("single", len(regions), single_time))
+    print("{:<10}{:>10}{:>12.3f}".format("batch", len(regions), batch_time))
+
+
+def append_merge(regions_data):
+    # merge of regions as it was done by np.append in get_dict
+    result_dict = dict()
+
+    for row, key in enumerate(DataDownloader.headers):
+        column = np.array([], dtype=DataDownloader.headers_type[row])
+
+        for dict_of_region in regions_data:
+            column = np.append(column, dict_of_region[key])
+
+        result_dict[key] = column
+
+    return result_dict
+
+
+def traced(function, *args):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return duration, peak, result
+
+
+def bench_merge(folder, regions):
+    downloader = DataDownloader(folder=folder)
+    regions_data = list(downloader.parse_regions_data(regions).values())
+
+    append_time, append_peak, append_data = traced(append_merge, regions_data)
+    merge_time, merge_peak, merge_data = traced(downloader.merge_regions, regions_data)
+
+    if not same_columns(append_data, merge_data):
+        raise AssertionError("merged columns differ")
+
+    result_size = sum(column.nbytes for column in merge_data.values()) / 1048576
+
+    print("result size {:.1f} MB, {} rows".format(result_size, len(merge_data["p1"])))
+    print("{:<12}{:>12}{:>12}".format("merge", "time [s]", "peak [MB]"))
+    print("{:<12}{:>12.3f}{:>12.1f}".format("np.append", append_time, append_peak / 1048576))
+    print("{:<12}{:>12.3f}{:>12.1f}".format("prealloc", merge_time, merge_peak / 1048576))
+
+
+def bench_compact(folder, regions):
+    downloader = DataDownloader(folder=folder, compact=True)
+    downloader.parse_regions_data(regions)
+
+    # report of all regions together
+    report = dict()
+    for region in regions:
+        for name, (before, after) in downloader.memory_report[region].items():
+            total_before, total_after = report.get(name, (0, 0))
+            report[name] = (total_before + before, total_after + after)
+
+    print_memory_report(report)
+
+
+def remove_cache(downloader, regions):
+    for region in regions:
+        path = downloader._cache_path(region)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+        if os.path.exists(downloader._manifest_path(region)):
+            os.remove(downloader._manifest_path(region))
+
+
+def bench_get_dict(folder, regions, workers):
+    # caches of benchmark are separated from the real ones
+    serial = DataDownloader(folder=folder, cache_dirname="bench_serial_{}")
+    parallel = DataDownloader(folder=folder, cache_dirname="bench_parallel_{}")
+
+    try:
+        serial_time, serial_data = timed(serial.get_dict, regions)
+        parallel_time, parallel_data = timed(lambda: parallel.get_dict(regions, workers=workers))
+    finally:
+        remove_cache(serial, regions)
+        remove_cache(parallel, regions)
+
+    if not same_columns(serial_data, parallel_data):
+        raise AssertionError("parallel get_dict differs from serial")
+
+    print("{:<10}{:>10}{:>12}".format("mode", "workers", "time [s]"))
+    print("{:<10}{:>10}{:>12.3f}".format("serial", 1, serial_time))
+    print("{:<10}{:>10}{:>12.3f}".format("parallel", workers, parallel_time))
+
+
+def bench_cache(folder, regions, repeat=1):
+    # write and read of parsed regions in legacy gzip pickle and in column files with every codec
+    downloader = DataDownloader(folder=folder)
+    data = downloader.merge_regions(list(downloader.parse_regions_data(regions).values()))
+    path = os.path.join(folder, "bench_cache")
+
+    def write_pickle():
+        with gzip.open(path, "wb") as f:
+            pickle.dump(data, f)
+
+    def read_pickle():
+        with gzip.open(path, "rb") as f:
+            return pickle.load(f)
+
+    print("size {:.1f} MB, {} rows".format(sum(column.nbytes for column in data.values()) / 1048576, len(data["p1"])))
+    print("{:<12}{:>12}{:>12}{:>12}".format("codec", "write [s]", "read [s]", "size [MB]"))
+
+    formats = [("gzip pickle", write_pickle, read_pickle)]
+    for codec in available_codecs():
+        formats.append((codec, lambda codec=codec: save_columns(path, data, codec), lambda: load_columns(path)))
+
+    for name, write, read in formats:
+        try:
+            write_time, _ = timed(write, repeat=repeat)
+            read_time, result = timed(read, repeat=repeat)
+            size = os.path.getsize(path) if os.path.isfile(path) else \
+                sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        finally:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+        if not same_columns(data, result):
+            raise AssertionError("cache {} differs from parsed data".format(name))
+
+        print("{:<12}{:>12.3f}{:>12.3f}{:>12.1f}".format(name, write_time, read_time, size / 1048576))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument("stage", choices=["parse", "batch", "get_dict", "merge", "compact", "cache"], help="Benchmarked part of ingest")
+    arg_parser.add_argument("--folder", default="data", help="Folder with downloaded ZIP files")
+    arg_parser.add_argument("--regions", nargs="*", help="Shortcuts of regions (default all)")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="Number of repetitions, best time is reported")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes for get_dict")
+
+    args = arg_parser.parse_args()
+
+    regions = args.regions or list(DataDownloader.regions)
+
+    if args.stage == "parse":
+        bench_parse(args.folder, regions, args.repeat)
+    elif args.stage == "batch":
+        bench_batch(args.folder, regions, args.repeat)
+    elif args.stage == "get_dict":
+        bench_get_dict(args.folder, regions, args.workers)
+    elif args.stage == "merge":
+        bench_merge(args.folder, regions)
+    elif args.stage == "compact":
+        bench_compact(args.folder, regions)
+    elif args.stage == "cache":
+        bench_cache(args.folder, regions, args.repeat)
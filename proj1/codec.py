@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import zlib
+
+# fast codecs are optional, they are available only when their package is installed
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec:
+    # bytes are stored without compression, files can be mapped into memory
+    name = "raw"
+    extension = ""
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    extension = ".zlib"
+
+    def __init__(self, level=1):
+        # lowest level, cache is written often and ratio of higher levels is only slightly better
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Codec(Codec):
+    name = "lz4"
+    extension = ".lz4"
+
+    def __init__(self):
+        if lz4 is None:
+            raise ImportError("codec \"lz4\" needs package lz4")
+
+    def compress(self, data):
+        return lz4.frame.compress(data)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    extension = ".zst"
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ImportError("codec \"zstd\" needs package zstandard")
+
+        self.level = level
+
+    # compressor objects are not shared, columns are compressed by many threads
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS = {"raw": Codec, "zlib": ZlibCodec, "lz4": Lz4Codec, "zstd": ZstdCodec}
+
+
+def get_codec(codec):
+    # name of codec or already created codec
+    if isinstance(codec, Codec):
+        return codec
+
+    if codec not in CODECS:
+        raise ValueError("unknown codec {}, known are {}".format(codec, ", ".join(CODECS)))
+
+    return CODECS[codec]()
+
+
+def codec_of(filename):
+    # codec of stored file is known from its extension
+    for codec in CODECS.values():
+        if codec.extension and filename.endswith(codec.extension):
+            return codec()
+
+    return Codec()
+
+
+def available_codecs():
+    return [name for name, codec in CODECS.items()
+            if (name != "lz4" or lz4 is not None) and (name != "zstd" or zstandard is not None)]
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import argparse
+import io
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from codec import get_codec, codec_of, available_codecs
+from compact import EncodedColumn
+
+# file with names and order of columns stored in folder
+INDEX_FILENAME = "columns.json"
+# minimum and maximum of every block of rows, queries skip blocks without matching rows
+STATS_FILENAME = "stats.json"
+CHUNK_ROWS = 8192
+
+
+def column_filename(index):
+    # names of columns contain characters like "(", so files are numbered
+    return "{:03d}.npy".format(index)
+
+
+def save_columns(path, columns, codec="raw", workers=None, chunk_rows=CHUNK_ROWS):
+    codec = get_codec(codec)
+    tmp_path = path + ".tmp"
+
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    index = dict()
+    arrays = dict()
+    stats = dict()
+    for number, (name, values) in enumerate(columns.items()):
+        filename = column_filename(number) + codec.extension
+
+        # encoded column is stored as codes and table of values
+        if isinstance(values, EncodedColumn):
+            categories_filename = filename.replace(".npy", ".categories.npy")
+
+            arrays[filename] = values.codes
+            arrays[categories_filename] = values.categories
+            index[name] = [filename, categories_filename]
+            continue
+
+        values = np.asarray(values)
+
+        # strings from pandas are objects, they are stored as fixed width unicode
+        if values.dtype == object:
+            values = values.astype('U')
+
+        arrays[filename] = values
+        index[name] = filename
+
+        if values.dtype.kind in "iufM" and len(values):
+            stats[name] = chunk_stats(values, chunk_rows)
+
+    # columns are compressed in parallel, compression releases GIL
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: save_array(os.path.join(tmp_path, item[0]), item[1], codec),
+                          arrays.items()))
+
+    with open(os.path.join(tmp_path, INDEX_FILENAME), "w") as f:
+        json.dump(index, f, indent=2)
+
+    with open(os.path.join(tmp_path, STATS_FILENAME), "w") as f:
+        json.dump({"chunk_rows": chunk_rows, "columns": stats}, f)
+
+    # replace old folder only when new one is complete
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def save_array(filename, values, codec):
+    if not codec.extension:
+        np.save(filename, values, allow_pickle=False)
+        return
+
+    buffer = io.BytesIO()
+    np.save(buffer, values, allow_pickle=False)
+
+    with open(filename, "wb") as f:
+        f.write(codec.compress(buffer.getbuffer()))
+
+
+def chunk_stats(values, chunk_rows):
+    starts = np.arange(0, len(values), chunk_rows)
+
+    # missing values of floats (NaN) are ignored
+    minimum = np.fmin.reduceat(values, starts)
+    maximum = np.fmax.reduceat(values, starts)
+
+    # dates are stored as text
+    if values.dtype.kind == "M":
+        minimum, maximum = minimum.astype(str), maximum.astype(str)
+
+    return {"dtype": values.dtype.str, "min": minimum.tolist(), "max": maximum.tolist()}
+
+
+def stored_stats(path):
+    # stores made before stats were added have none
+    if not os.path.isfile(os.path.join(path, STATS_FILENAME)):
+        return None
+
+    with open(os.path.join(path, STATS_FILENAME)) as f:
+        stats = json.load(f)
+
+    return stats["chunk_rows"], {name: (np.array(column["min"], dtype=column["dtype"]),
+                                        np.array(column["max"], dtype=column["dtype"]))
+                                 for name, column in stats["columns"].items()}
+
+
+def is_column_store(path):
+    return os.path.isfile(os.path.join(path, INDEX_FILENAME))
+
+
+def stored_columns(path):
+    with open(os.path.join(path, INDEX_FILENAME)) as f:
+        return json.load(f)
+
+
+class ConcatenatedColumn:
+    # mapped columns of several regions are used as one column, rows are copied only when they are selected
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.ends = np.cumsum([len(part) for part in self.parts])
+        self.starts = self.ends - [len(part) for part in self.parts]
+        self.dtype = np.result_type(*[part.dtype for part in self.parts])
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    @property
+    def ndim(self):
+        return 1
+
+    @property
+    def nbytes(self):
+        return sum(part.nbytes for part in self.parts)
+
+    def __len__(self):
+        return int(self.ends[-1]) if len(self.ends) else 0
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.concatenate(self.parts).astype(self.dtype, copy=False)
+
+        return values if dtype is None else values.astype(dtype)
+
+    def _locate(self, rows):
+        # part and position in part for every row
+        parts = np.searchsorted(self.ends, rows, side="right")
+
+        return parts, rows - self.starts[parts]
+
+    def __getitem__(self, key):
+        if np.ndim(key) == 0 and not isinstance(key, slice):
+            row = int(key) + len(self) if int(key) < 0 else int(key)
+            if not 0 <= row < len(self):
+                raise IndexError("index {} is out of bounds for column of length {}".format(key, len(self)))
+
+            part, position = self._locate(row)
+            return self.parts[part][position]
+
+        # slice, mask or indexes are turned into indexes of rows
+        if isinstance(key, slice):
+            rows = np.arange(*key.indices(len(self)))
+        else:
+            rows = np.asarray(key)
+            rows = np.flatnonzero(rows) if rows.dtype == bool else np.where(rows < 0, rows + len(self), rows)
+
+        parts, positions = self._locate(rows)
+        values = np.empty(len(rows), dtype=self.dtype)
+
+        for number in np.unique(parts):
+            selected = parts == number
+            values[selected] = self.parts[number][positions[selected]]
+
+        return values
+
+    def _compare(self, other, compare):
+        # compare with one value is done part by part
+        if np.ndim(other) == 0:
+            return np.concatenate([compare(part, other) for part in self.parts])
+
+        return compare(np.asarray(self), np.asarray(other))
+
+    def __eq__(self, other):
+        return self._compare(other, np.equal)
+
+    def __ne__(self, other):
+        return self._compare(other, np.not_equal)
+
+    def __lt__(self, other):
+        return self._compare(other, np.less)
+
+    def __le__(self, other):
+        return self._compare(other, np.less_equal)
+
+    def __gt__(self, other):
+        return self._compare(other, np.greater)
+
+    def __ge__(self, other):
+        return self._compare(other, np.greater_equal)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ConcatenatedColumn({} parts, {} rows, {})".format(len(self.parts), len(self), self.dtype)
+
+
+def load_columns(path, columns=None, mmap_mode=None, workers=None):
+    index = stored_columns(path)
+
+    if columns is None:
+        columns = list(index)
+
+    missing = [name for name in columns if name not in index]
+    if missing:
+        raise KeyError("columns {} are not in {}".format(missing, path))
+
+    # only requested columns are read from disk, with mmap_mode they are mapped into memory instead
+    if not any(codec_of(filename).extension for name in columns for filename in column_files(index[name])):
+        return {name: load_column(path, index[name], mmap_mode) for name in columns}
+
+    # compressed columns are decompressed in parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(columns, executor.map(lambda name: load_column(path, index[name], mmap_mode), columns)))
+
+
+def column_files(filename):
+    # encoded column has two files
+    return filename if isinstance(filename, list) else [filename]
+
+
+def load_column(path, filename, mmap_mode=None):
+    if isinstance(filename, list):
+        return EncodedColumn(load_array(os.path.join(path, filename[0]), mmap_mode),
+                             load_array(os.path.join(path, filename[1])))
+
+    return load_array(os.path.join(path, filename), mmap_mode)
+
+
+def load_array(filename, mmap_mode=None):
+    codec = codec_of(filename)
+
+    if not codec.extension:
+        return np.load(filename, mmap_mode=mmap_mode, allow_pickle=False)
+
+    # compressed file can not be mapped, it is always read into memory
+    with open(filename, "rb") as f:
+        return np.lib.format.read_array(io.BytesIO(codec.decompress(f.read())), allow_pickle=False)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert pickled DataFrame into folder with column files")
+
+    arg_parser.add_argument("source", help="Path to pickled DataFrame (accidents.pkl.gz)")
+    arg_parser.add_argument("target", help="Path to output folder")
+    arg_parser.add_argument("--codec", default="raw", choices=available_codecs(), help="Compression of columns")
+
+    args = arg_parser.parse_args()
+
+    import pandas as pd
+
+    df = pd.read_pickle(args.source)
+    save_columns(args.target, {col: df[col].to_numpy() for col in df.columns}, args.codec)
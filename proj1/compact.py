@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# text columns with few different values, they are stored as codes into table of values
+# (p5a is parsed as integer, so it is only narrowed)
+ENCODED_COLUMNS = ["region", "j", "o", "p", "t"]
+
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def narrow_type(minimum, maximum):
+    # smallest signed integer, which holds whole range of values (-1 is used for missing values)
+    for integer_type in INTEGER_TYPES:
+        info = np.iinfo(integer_type)
+        if info.min <= minimum and maximum <= info.max:
+            return np.dtype(integer_type)
+
+    return np.dtype(np.int64)
+
+
+class EncodedColumn:
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def encode(cls, values):
+        categories, codes = np.unique(values, return_inverse=True)
+
+        return cls(codes.astype(narrow_type(0, len(categories))), categories)
+
+    @classmethod
+    def concatenate(cls, columns):
+        categories = np.unique(np.concatenate([column.categories for column in columns]))
+        code_type = narrow_type(0, len(categories))
+
+        codes = np.empty(sum(len(column) for column in columns), dtype=code_type)
+
+        # codes of every part are translated into merged table of values
+        position = 0
+        for column in columns:
+            translation = np.searchsorted(categories, column.categories).astype(code_type)
+            codes[position:position + len(column)] = translation[column.codes]
+            position += len(column)
+
+        return cls(codes, categories)
+
+    def decode(self):
+        return self.categories[self.codes]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.decode()
+
+        return values if dtype is None else values.astype(dtype)
+
+    def __getitem__(self, key):
+        codes = self.codes[key]
+
+        if np.ndim(codes) == 0:
+            return self.categories[codes]
+
+        return EncodedColumn(codes, self.categories)
+
+    def __eq__(self, other):
+        # compare with one value is done on codes
+        if np.ndim(other) == 0:
+            found = np.flatnonzero(self.categories == other)
+
+            if len(found) == 0:
+                return np.zeros(len(self), dtype=bool)
+
+            return self.codes == found[0]
+
+        return self.decode() == np.asarray(other)
+
+    def __ne__(self, other):
+        return ~(self == other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "EncodedColumn({!r})".format(self.decode())
+
+
+def compact_columns(columns):
+    compacted = dict()
+    report = dict()
+
+    for name, values in columns.items():
+        if isinstance(values, EncodedColumn):
+            compacted[name] = values
+
+        elif name in ENCODED_COLUMNS:
+            compacted[name] = EncodedColumn.encode(values)
+
+        elif values.dtype.kind == 'i':
+            if len(values):
+                compacted[name] = values.astype(narrow_type(values.min(), values.max()), copy=False)
+            else:
+                compacted[name] = values.astype(np.int8)
+
+        else:
+            compacted[name] = values
+
+        # memory in bytes before and after
+        report[name] = (values.nbytes, compacted[name].nbytes)
+
+    return compacted, report
+
+
+def print_memory_report(report):
+    before_total = 0
+    after_total = 0
+
+    print("{:<16}{:>14}{:>14}".format("column", "before [kB]", "after [kB]"))
+
+    for name, (before, after) in report.items():
+        print("{:<16}{:>14.1f}{:>14.1f}".format(name, before / 1024, after / 1024))
+
+        before_total += before
+        after_total += after
+
+    print("{:<16}{:>14.1f}{:>14.1f}".format("total", before_total / 1024, after_total / 1024))
@@ -4,12 +4,24 @@ import numpy as np
 
 import os
 import io
+import itertools
 import requests
 from bs4 import BeautifulSoup as bs
 import zipfile
 import csv
 import gzip
 import pickle
+import json
+import tempfile
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from codec import get_codec
+from columnar import save_columns, load_columns, stored_stats, ConcatenatedColumn
+from compact import EncodedColumn, compact_columns
+from region_cache import RegionCache, DEFAULT_MAX_BYTES
+from query import make_predicates, region_matches, row_mask, chunk_mask, chunk_rows_index, take_rows
+import instrument
 
 
 class DataDownloader:
@@ -40,93 +52,676 @@ class DataDownloader:
         "KVK": "19",
     }
 
-    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz"):
+    # information about downloaded files (ETag, Last-Modified, size)
+    meta_filename = "downloads.json"
+
+    # translation table from cp1250 bytes into unicode code points
+    _cp1250 = None
+
+    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz",
+                 engine="columns", cache_format="columns", cache_dirname="data_{}", mmap=False, compact=False,
+                 cache_codec="raw", region_cache_bytes=DEFAULT_MAX_BYTES):
         self.url = url
         self.folder = folder
         self.cache_filename = cache_filename
+        # "columns" parses csv in bulk, "rows" is original cell by cell parser
+        self.engine = engine
+        # "pickle" is one gzip file per region, "columns" is folder with one .npy file per column
+        self.cache_format = cache_format
+        self.cache_dirname = cache_dirname
+        # compression of column files ("raw", "zlib", "lz4", "zstd"), columns are compressed in parallel
+        self.cache_codec = get_codec(cache_codec)
+        # columns of cache are mapped read-only into memory and shared with other processes
+        self.mmap = mmap
+
+        # narrow integer types and encoded text columns, memory of columns is kept in memory_report
+        self.compact = compact
+        self.memory_report = dict()
+
+        if mmap and cache_format != "columns":
+            raise ValueError("mmap needs cache_format=\"columns\"")
+        if mmap and self.cache_codec.extension:
+            raise ValueError("mmap needs cache_codec=\"raw\"")
         
-        self.global_dict_of_regions = dict()
+        # parsed and loaded regions with state of ZIP files, from which they were made
+        self.region_cache = RegionCache(region_cache_bytes)
+        # number of duplicate accidents removed from every ZIP file (or region in merged data)
+        self.duplicates_removed = dict()
 
-    def download_data(self):
+    def download_data(self, workers=4):
         # make folder if not exists
         if not os.path.exists(self.folder):
             os.makedirs(self.folder)
 
-        page = requests.get(self.url)
+        # one session with pool of connections shared by all transfers
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        page = session.get(self.url)
+        page.raise_for_status()
         soup = bs(page.content, 'html.parser')
     
         tr = soup.find_all('tr')
 
+        file_names = []
         for i in tr:
             btn = i.find_all('button')[-1]
-            file_name = btn.get('onclick').split('\'')[1]    # get address for download
-            link = self.url + file_name
+            file_names.append(btn.get('onclick').split('\'')[1])    # get address for download
+
+        meta = self._load_download_meta()
+
+        with instrument.stage("download", files=len(file_names)) as record:
+            written = 0
+            errors = []
+
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(self._download_file, session, name, meta.get(name)): name
+                               for name in file_names}
+
+                    for future in as_completed(futures):
+                        file_name = futures[future]
+
+                        # failed transfer does not stop others, it is raised at the end
+                        try:
+                            file_meta = future.result()
+                        except Exception as error:
+                            errors.append(error)
+                            continue
+
+                        # unchanged files keep their old metadata
+                        if file_meta is not meta.get(file_name):
+                            written += (file_meta or {}).get('size') or 0
+                        meta[file_name] = file_meta
+
+                        # metadata of every finished file is saved at once, so next run can resume
+                        self._save_download_meta(meta)
+            finally:
+                session.close()
+                self._save_download_meta(meta)
+
+            record.bytes_written = written
+
+        if errors:
+            raise errors[0]
 
-            with open(file_name, 'wb') as file:
-                response = requests.get(link)
-                file.write(response.content)
+    def _load_download_meta(self):
+        meta_path = os.path.join(self.folder, self.meta_filename)
+
+        if not os.path.exists(meta_path):
+            return dict()
+
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _save_download_meta(self, meta):
+        # old metadata are replaced only by complete file
+        meta_path = os.path.join(self.folder, self.meta_filename)
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _download_file(self, session, file_name, file_meta):
+        link = self.url + file_name
+        path = os.path.join(self.folder, os.path.basename(file_name))
+
+        # ask server only for changed file
+        headers = dict()
+        exists = os.path.exists(path)
+        if exists and file_meta is not None:
+            if file_meta.get('etag'):
+                headers['If-None-Match'] = file_meta['etag']
+            if file_meta.get('last_modified'):
+                headers['If-Modified-Since'] = file_meta['last_modified']
+
+        with session.get(link, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return file_meta
+
+            response.raise_for_status()
+
+            new_meta = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'size': int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None,
+            }
+
+            # file without metadata (e.g. from interrupted run) is same if it has size from Content-Length
+            if exists and file_meta is None and new_meta['size'] is not None and \
+                    os.path.getsize(path) == new_meta['size']:
+                return new_meta
+
+            # server without conditional requests, file is same if size and validators are same
+            if exists and file_meta is not None and \
+                    os.path.getsize(path) == file_meta.get('size') == new_meta['size'] and \
+                    new_meta['etag'] == file_meta.get('etag') and \
+                    new_meta['last_modified'] == file_meta.get('last_modified'):
+                return file_meta
+
+            # body is streamed into temporary file, which replaces old file when it is complete
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        file.write(chunk)
+
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        new_meta['size'] = os.path.getsize(path)
+
+        return new_meta
 
     def parse_region_data(self, region):
+        return self.parse_regions_data([region])[region]
+
+    def parse_regions_data(self, regions, archives=None):
         # check if folder exist and is not empty
         if not os.path.exists(self.folder) or len(os.listdir(self.folder)) == 0:
             self.download_data()
 
-        # get name of file for region 
+        # by default all ZIP files are parsed
+        if archives is None:
+            archives = self._archives()
+
+        if self.engine == "rows":
+            dict_of_regions = dict()
+
+            for region in regions:
+                with instrument.stage("parse", region=region, engine="rows") as record:
+                    dict_of_regions[region] = self._parse_region_rows(region, archives)
+                    record.rows = len(dict_of_regions[region]["p1"])
+
+            return self._compact(dict_of_regions)
+
+        parts = {region: [] for region in regions}
+
+        # open every ZIP file only once and read raw bytes of csv for all regions
+        with instrument.stage("zip_read", archives=len(archives)) as record:
+            for f in archives:
+                with zipfile.ZipFile(os.path.join(self.folder, f)) as zip_file:
+                    for region in parts:
+                        part = zip_file.read(self.regions.get(region) + '.csv')
+
+                        if part and not part.endswith(b'\n'):
+                            part += b'\n'
+
+                        parts[region].append(part)
+
+            record.bytes_read = sum(len(part) for region_parts in parts.values() for part in region_parts)
+
+        dict_of_regions = dict()
+
+        for region in regions:
+            if region not in dict_of_regions:
+                with instrument.stage("parse", region=region, engine="columns") as record:
+                    # raw bytes are released as soon as region is parsed
+                    record.bytes_read = sum(len(part) for part in parts[region])
+                    dict_of_regions[region] = self._parse_region_columns(region, parts.pop(region), archives)
+                    record.rows = len(dict_of_regions[region]["p1"])
+
+        return self._compact(dict_of_regions)
+
+    def _archives(self):
+        # names of all ZIP files in folder
+        return [f for f in os.listdir(self.folder) if f.endswith('.zip')]
+
+    def _archive_state(self):
+        # size and time of modification of every ZIP file, changed file has to be parsed again
+        if not os.path.exists(self.folder):
+            return dict()
+
+        state = dict()
+        for f in self._archives():
+            stat = os.stat(os.path.join(self.folder, f))
+            state[f] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+        return state
+
+    def _compact(self, dict_of_regions):
+        if not self.compact:
+            return dict_of_regions
+
+        for region in dict_of_regions:
+            dict_of_regions[region], self.memory_report[region] = compact_columns(dict_of_regions[region])
+
+        return dict_of_regions
+
+    def _parse_region_rows(self, region, archives):
+        return self._parse_csv_rows(region, self._open_region_csv(region, archives))
+
+    def _open_region_csv(self, region, archives):
+        # get name of file for region
         region_file = self.regions.get(region) + '.csv'
 
+        # iterate through all ZIP file
+        for f in archives:
+            with zipfile.ZipFile(os.path.join(self.folder, f)) as zip_file:
+                with zip_file.open(region_file, 'r') as region_csv:
+                    yield f, region_csv
+
+    def _parse_csv_rows(self, region, sources):
         list_of_columns = [[] for _ in range(65)]
         np_arrays = []
 
         id_set = set()
         dict_of_region = dict()
+        removed = dict()
 
-        # iterate through all ZIP file 
-        for f in os.listdir(self.folder):
-            # check if file is ZIP file 
-            if not f.endswith('.zip'):
-                continue
+        # iterate through all csv files (name of ZIP file and binary stream)
+        for f, region_csv in sources:
+            removed[f] = 0
+            reader_csv = csv.reader(io.TextIOWrapper(region_csv, encoding='cp1250'), delimiter=';')
 
-            with zipfile.ZipFile('data/' + f) as zip_file:
-                with zip_file.open(region_file, 'r') as region_csv:
-                    reader_csv = csv.reader(io.TextIOWrapper(region_csv, encoding='cp1250'), delimiter=';')
+            # iterate through all rows in csv file 
+            for line in reader_csv:
 
-                    # iterate through all rows in csv file 
-                    for line in reader_csv:
+                # check of duplicates 
+                if not line[0] in id_set:
+                    id_set.add(line[0])
+                else:
+                    removed[f] += 1
+                    continue
 
-                        # check of duplicates 
-                        if not line[0] in id_set:
-                            id_set.add(line[0])
-                        else:
-                            continue
+                # iterate through all items in on row 
+                for index in range(0, len(line)):
+                    if not line[index] in ['', "XX"]:
+
+                        if self.headers_type[index] == 'f':
+                            line[index] = line[index].replace(",", ".")     # if float change "," to "."
+                            try:
+                                float(line[index])
+                            except:
+                                line[index] = -1
+                                
+                        list_of_columns[index].append(line[index])
 
-                        # iterate through all items in on row 
-                        for index in range(0, len(line)):
-                            if not line[index] in ['', "XX"]:
-
-                                if self.headers_type[index] == 'f':
-                                    line[index] = line[index].replace(",", ".")     # if float change "," to "."
-                                    try:
-                                        float(line[index])
-                                    except:
-                                        line[index] = -1
-                                        
-                                list_of_columns[index].append(line[index])
-
-                            else:
-                                list_of_columns[index].append(-1)
-                        
-                        list_of_columns[-1].append(region)       # at the end of array shortcut for region
+                    else:
+                        list_of_columns[index].append(-1)
+                
+                list_of_columns[-1].append(region)       # at the end of array shortcut for region
          
         for index in range(0, len(list_of_columns)):
             np_arrays.append(np.array(list_of_columns[index], dtype=self.headers_type[index]))
             
             dict_of_region[self.headers[index]] = np_arrays[index]
 
+        self.duplicates_removed[region] = removed
+
         return dict_of_region
 
-    def get_dict(self, regions=None):
+    def _parse_region_columns(self, region, parts, archives):
+        buffer = np.frombuffer(b''.join(parts), dtype=np.uint8)
+        fields = self._split_fields(buffer, len(self.headers) - 1)
+
+        # csv with quoted separators, escaped quotes etc. is parsed cell by cell
+        if fields is None:
+            return self._parse_csv_rows(region, [(f, io.BytesIO(part)) for f, part in zip(archives, parts)])
+
+        starts, ends = fields
+
+        # index of ZIP file for every row
+        sources = np.repeat(np.arange(len(parts)), [part.count(b'\n') for part in parts])
+
+        # check of duplicates, first occurrence of accident is kept
+        ids = self._column_bytes(buffer, starts[:, 0], ends[:, 0])
+        keep, removed = self.find_duplicates(ids, sources, archives)
+        self.duplicates_removed[region] = removed
+
+        # fields of one column are next to each other in memory
+        starts = np.ascontiguousarray(starts[keep].T)
+        ends = np.ascontiguousarray(ends[keep].T)
+
+        dict_of_region = dict()
+
+        for index in range(len(starts)):
+            dict_of_region[self.headers[index]] = self._make_column(buffer, starts[index], ends[index],
+                                                                    self.headers_type[index])
+
+        # at the end shortcut for region
+        dict_of_region[self.headers[-1]] = np.array([region] * len(keep), dtype=self.headers_type[-1])
+
+        return dict_of_region
+
+    @staticmethod
+    def find_duplicates(keys, sources=None, source_names=None):
+        # sort based search of first occurrence of every key, order of rows is kept
+        _, first = np.unique(np.asarray(keys), return_index=True)
+        keep = np.sort(first)
+
+        if sources is None:
+            return keep, {}
+
+        # number of removed rows for every source (ZIP file or region)
+        removed_rows = np.ones(len(keys), dtype=bool)
+        removed_rows[keep] = False
+        counts = np.bincount(sources[removed_rows], minlength=len(source_names))
+
+        removed = dict()
+        for name, count in zip(source_names, counts):
+            removed[name] = removed.get(name, 0) + int(count)
+
+        return keep, removed
+
+    def deduplicate(self, dict_of_data, key="p1", sources=None, source_names=None):
+        keep, removed = self.find_duplicates(dict_of_data[key], sources, source_names)
+
+        return {name: values[keep] for name, values in dict_of_data.items()}, removed
+
+    @staticmethod
+    def _split_fields(buffer, columns):
+        # positions of all separators, every row has to end with new line
+        separators = np.flatnonzero((buffer == ord(';')) | (buffer == ord('\n')))
+
+        if len(separators) == 0:
+            empty = np.empty((0, columns), dtype=np.intp)
+            return empty, empty
+
+        if len(separators) % columns != 0:
+            return None
+
+        line_ends = separators[columns - 1::columns]
+        if np.count_nonzero(buffer == ord('\n')) != len(line_ends) or np.any(buffer[line_ends] != ord('\n')):
+            return None
+
+        starts = np.empty_like(separators)
+        starts[0] = 0
+        starts[1:] = separators[:-1] + 1
+        ends = separators.copy()
+
+        # remove "\r" from windows line ends
+        carriage = (buffer[np.maximum(ends - 1, 0)] == ord('\r')) & (ends > starts)
+        ends[carriage] -= 1
+
+        # remove quotes around fields
+        quoted = (ends - starts >= 2) & (buffer[starts] == ord('"')) & (buffer[np.maximum(ends - 1, 0)] == ord('"'))
+
+        # quotes inside of fields are not supported here
+        if np.count_nonzero(buffer == ord('"')) != 2 * np.count_nonzero(quoted):
+            return None
+
+        starts[quoted] += 1
+        ends[quoted] -= 1
+
+        return starts.reshape(-1, columns), ends.reshape(-1, columns)
+
+    @staticmethod
+    def _column_matrix(buffer, starts, ends, width=None):
+        lengths = ends - starts
+        if width is None:
+            width = int(lengths.max(initial=0))
+
+        # every field is copied as one item of "width" bytes starting at its first byte
+        # (only row indexes are made, no index for every byte of matrix)
+        width = max(width, 1)
+        inner = starts <= len(buffer) - width
+        windows = np.ndarray((max(len(buffer) - width + 1, 0),), dtype='V{}'.format(width), buffer=buffer,
+                             strides=(1,))
+
+        if inner.all():
+            matrix = windows[starts].view(np.uint8).reshape(-1, width)
+        else:
+            matrix = np.zeros((len(starts), width), dtype=np.uint8)
+            matrix[inner] = windows[starts[inner]].view(np.uint8).reshape(-1, width)
+
+            # few fields at the end of buffer do not have whole item
+            for row in np.flatnonzero(~inner):
+                matrix[row, :lengths[row]] = buffer[starts[row]:ends[row]]
+
+        # bytes after end of field are zero
+        matrix[np.arange(width) >= lengths[:, None]] = 0
+
+        return matrix
+
+    @classmethod
+    def _column_bytes(cls, buffer, starts, ends):
+        matrix = cls._column_matrix(buffer, starts, ends)
+
+        return matrix.view('S{}'.format(matrix.shape[1])).ravel()
+
+    @classmethod
+    def _make_column(cls, buffer, starts, ends, dtype):
+        if len(starts) == 0:
+            return np.array([], dtype=dtype)
+
+        lengths = ends - starts
+
+        # missing values are replaced by -1
+        missing = lengths == 0
+        pairs = np.flatnonzero(lengths == 2)
+        missing[pairs] = (buffer[starts[pairs]] == ord('X')) & (buffer[starts[pairs] + 1] == ord('X'))
+
+        # text is as wide as its longest value, "-1" of missing values included
+        width = int(lengths.max())
+        if dtype == 'U' and missing.any():
+            width = max(width, 2)
+
+        matrix = cls._column_matrix(buffer, starts, ends, width)
+
+        if dtype == 'U':
+            # missing values are written into decoded array, it is not copied
+            values = cls._decode(matrix)
+            values[missing] = '-1'
+            return values
+
+        if dtype == 'i':
+            digits = matrix.astype(np.int16) - ord('0')
+            inside = np.arange(matrix.shape[1]) < lengths[:, None]
+
+            # only plain numbers are parsed here, everything else is left to numpy
+            if np.all((digits >= 0) & (digits <= 9) | ~inside | missing[:, None]):
+                values = np.zeros(len(lengths), dtype=np.int64)
+                for position in range(matrix.shape[1]):
+                    values = np.where(inside[:, position], values * 10 + digits[:, position], values)
+
+                values[missing] = -1
+                return values.astype(dtype)
+
+        if dtype == 'f':
+            matrix[matrix == ord(',')] = ord('.')     # if float change "," to "."
+
+        values = np.where(missing, b'-1', matrix.view('S{}'.format(matrix.shape[1])).ravel())
+
+        # dates can not be parsed from '-1', use same conversion as for single cells
+        if dtype == 'M' and missing.any():
+            return np.array([-1 if m else v.decode() for v, m in zip(values.tolist(), missing)], dtype=dtype)
+
+        try:
+            return values.astype(dtype)
+        except ValueError:
+            if dtype != 'f':
+                raise
+
+        # some of values is not a float, change them to -1
+        checked = []
+        for value in values.tolist():
+            try:
+                float(value)
+                checked.append(value)
+            except ValueError:
+                checked.append(b'-1')
+
+        return np.array(checked).astype(dtype)
+
+    @classmethod
+    def _decode(cls, matrix):
+        # cp1250 has one byte per character, so bytes are translated by table
+        if cls._cp1250 is None:
+            table = np.zeros(256, dtype=np.uint32)
+            for byte in range(256):
+                try:
+                    table[byte] = ord(bytes([byte]).decode('cp1250'))
+                except UnicodeDecodeError:
+                    table[byte] = 0xFFFFFFFF
+            cls._cp1250 = table
+
+        characters = cls._cp1250[matrix]
+
+        # bytes which are not defined in cp1250 raise same error as decoding in csv reader
+        if np.any(characters == 0xFFFFFFFF):
+            return np.char.decode(matrix.view('S{}'.format(matrix.shape[1])).ravel(), 'cp1250')
+
+        return np.ascontiguousarray(characters).view('U{}'.format(matrix.shape[1])).ravel()
+
+    def parse_and_cache(self, region):
+        state = self._archive_state()
+
+        dict_of_region = self.parse_region_data(region)
+        self._save_cache(region, dict_of_region, state)
+
+        return dict_of_region
+
+    def _save_cache(self, region, dict_of_region, state):
+        # compact downloader stores compact columns, readers without compact expand them in _memory_format
+        # make cache file
+        with instrument.stage("cache_write", region=region, format=self.cache_format) as record:
+            if self.cache_format == "columns":
+                save_columns(self._cache_path(region), dict_of_region, self.cache_codec)
+            else:
+                with gzip.open(self._cache_path(region), "wb") as f:
+                    pickle.dump(dict_of_region, f)
+
+            if instrument.enabled():
+                record.rows = len(dict_of_region["p1"])
+                record.bytes_written = self._cache_size(region)
+
+        # list of ZIP files, from which was cache made
+        with open(self._manifest_path(region), "w") as f:
+            json.dump(state, f, indent=2)
+
+    def _load_manifest(self, region):
+        if not os.path.exists(self._manifest_path(region)):
+            return None
+
+        with open(self._manifest_path(region)) as f:
+            return json.load(f)
+
+    def _manifest_path(self, region):
+        return self._cache_path(region) + ".manifest.json"
+
+    def _update_regions(self, regions, state, new_archives):
+        dicts_of_regions = {region: self._load_cache(region) for region in regions}
+        removed = {region: dict() for region in regions}
+
+        # new ZIP files are added one by one, so accidents already in cache are counted for their file
+        for archive in new_archives:
+            new_data = self.parse_regions_data(regions, [archive])
+
+            for region in regions:
+                dict_of_region = dicts_of_regions[region]
+
+                # only accidents, which are not in cache yet, are added
+                new_rows = ~np.isin(np.asarray(new_data[region]["p1"]), np.asarray(dict_of_region["p1"]))
+                new_region = {key: values[new_rows] for key, values in new_data[region].items()}
+
+                removed[region][archive] = self.duplicates_removed[region].get(archive, 0) + \
+                    int(np.count_nonzero(~new_rows))
+                dicts_of_regions[region] = self.merge_regions([dict_of_region, new_region])
+
+        for region in regions:
+            self.duplicates_removed[region] = removed[region]
+            self._save_cache(region, dicts_of_regions[region], state)
+
+    def _load_cache(self, region, columns=None):
+        with instrument.stage("cache_read", region=region, format=self.cache_format) as record:
+            if self.cache_format == "columns":
+                dict_of_region = load_columns(self._cache_path(region), columns,
+                                              mmap_mode='r' if self.mmap else None)
+            else:
+                with gzip.open(self._cache_path(region), "rb") as f:
+                    dict_of_region = self._select(pickle.load(f), columns)
+
+            if instrument.enabled():
+                record.rows = len(next(iter(dict_of_region.values()), []))
+                record.bytes_read = self._cache_size(region)
+
+        return self._memory_format(dict_of_region)
+
+    def _expand(self, dict_of_region):
+        # encoded and narrowed columns are returned into types of parser
+        expanded = dict()
+
+        for key, values in dict_of_region.items():
+            if isinstance(values, EncodedColumn):
+                values = values.decode()
+            elif values.dtype.kind == 'i':
+                values = values.astype(self.headers_type[self.headers.index(key)], copy=False)
+
+            expanded[key] = values
+
+        return expanded
+
+    def _memory_format(self, dict_of_region):
+        # cache could be made by downloader with other value of compact
+        if self.compact:
+            return compact_columns(dict_of_region)[0]
+
+        return self._expand(dict_of_region)
+
+    def _load_region(self, region, columns, state):
+        # columns of region, which are already in memory, are not read from disk again
+        cached = self.region_cache.cached_columns(region, state)
+
+        if columns is None:
+            dict_of_region = self._load_cache(region)
+        else:
+            dict_of_region = self._load_cache(region, [key for key in columns if key not in cached])
+
+        self.region_cache.put(region, state, dict_of_region, complete=columns is None)
+
+        return self._select({**cached, **dict_of_region}, columns)
+
+    def _cache_path(self, region):
+        # get path to gzip file or folder with columns of region
+        if self.cache_format == "columns":
+            return os.path.join(self.folder, self.cache_dirname.format(region))
+
+        return os.path.join(self.folder, self.cache_filename.format(region))
+
+    def _convert_legacy_cache(self, region):
+        # gzip file of older versions is read once and stored as column files with its manifest
+        legacy_path = os.path.join(self.folder, self.cache_filename.format(region))
+
+        if self.cache_format != "columns" or os.path.exists(self._cache_path(region)) or \
+                not os.path.exists(legacy_path):
+            return
+
+        with instrument.stage("cache_convert", region=region):
+            with gzip.open(legacy_path, "rb") as f:
+                save_columns(self._cache_path(region), pickle.load(f), self.cache_codec)
+
+            if os.path.exists(legacy_path + ".manifest.json"):
+                shutil.copyfile(legacy_path + ".manifest.json", self._manifest_path(region))
+
+    def _cache_size(self, region):
+        # size of cache file or of all files in folder with columns
+        path = self._cache_path(region)
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    @staticmethod
+    def _select(dict_of_region, columns):
+        if columns is None:
+            return dict_of_region
+
+        return {key: dict_of_region[key] for key in columns}
+
+    def _worker(self):
+        # copy of downloader without already parsed regions
+        return DataDownloader(self.url, self.folder, self.cache_filename, self.engine, self.cache_format,
+                              self.cache_dirname, self.mmap, self.compact, self.cache_codec,
+                              self.region_cache.max_bytes)
+
+    @instrument.instrumented("get_dict")
+    def get_dict(self, regions=None, workers=1, columns=None, dedup=False):
         regions_data = []
-        result_dict = dict()
         
         # if list 'regions' is empty put there all regions
         if regions is None:
@@ -134,42 +729,330 @@ class DataDownloader:
             for key in self.regions:
                 regions.append(key)
 
+        # p1 is needed for check of duplicates
+        requested = columns
+        if dedup and columns is not None and "p1" not in columns:
+            columns = list(columns) + ["p1"]
+
+        loaded = dict()
+        missing = []
+        updated = dict()
+
+        state = self._archive_state()
+
         # iterate through list regions[]
         for region in regions:
-            # get name of gzip file
-            gzip_name = self.cache_filename.format(region)
-            # get path to gzip file of region
-            gzip_path = self.folder + '/' + gzip_name
+            if region in loaded:
+                continue
+
+            self._convert_legacy_cache(region)
+            manifest = self._load_manifest(region) if os.path.exists(self._cache_path(region)) else None
 
-            if region in self.global_dict_of_regions:
-                regions_data.append(self.global_dict_of_regions[region])
+            cached = self.region_cache.get(region, state, columns)
 
-            elif os.path.exists(gzip_path):
-                with gzip.open(gzip_path, "rb") as f:
-                    regions_data.append(pickle.load(f))
+            if cached is not None:
+                loaded[region] = cached
+
+            # only new ZIP files are parsed and added to cache
+            elif manifest is not None and manifest != state and \
+                    all(state.get(f) == manifest[f] for f in manifest):
+                new_archives = tuple(f for f in state if f not in manifest)
+                updated.setdefault(new_archives, []).append(region)
+
+            # changed or removed ZIP file, region is parsed again
+            elif manifest is not None and manifest != state:
+                missing.append(region)
+
+            # only requested columns are read from cache (cache without manifest is used as it is)
+            elif os.path.exists(self._cache_path(region)):
+                loaded[region] = self._load_region(region, columns, state)
 
             # if region is not saved in cache or in memory
             else:
-                self.global_dict_of_regions[region] = self.parse_region_data(region)
-                
-                regions_data.append(self.global_dict_of_regions[region])
+                missing.append(region)
 
-                # make cache file
-                with gzip.open(gzip_path, "wb") as f:
-                    pickle.dump(self.global_dict_of_regions[region], f)
+        for new_archives, updated_regions in updated.items():
+            self._update_regions(updated_regions, state, list(new_archives))
 
-        # iterate through all rows
-        for row in range(len(regions_data[0])):
-            key = self.headers[row]
-            cols_value = [np.array([], dtype=self.headers_type[row])]
+            for region in updated_regions:
+                self.region_cache.discard(region)
+                loaded[region] = self._load_region(region, columns, state)
 
-            # iterate through all regions in one row 
-            for reg in range(len(regions_data)):
-                cols_value[0] = np.append(cols_value[0], regions_data[reg][key])
+        if missing:
+            # download data only once, before the workers start
+            if not os.path.exists(self.folder) or len(os.listdir(self.folder)) == 0:
+                self.download_data()
 
-            result_dict[key] = cols_value[0]
-        
-        return result_dict        
+            state = self._archive_state()
+
+            if workers > 1 and len(missing) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+                    parsed = list(executor.map(self._worker().parse_and_cache, missing))
+            else:
+                # all missing regions are read in one pass through ZIP files
+                dict_of_regions = self.parse_regions_data(missing)
+                parsed = [dict_of_regions[region] for region in missing]
+
+                for region in missing:
+                    self._save_cache(region, dict_of_regions[region], state)
+
+            for region, dict_of_region in zip(missing, parsed):
+                # parsed arrays are replaced by mapped cache, so they do not stay on heap
+                if self.mmap:
+                    dict_of_region = self._load_cache(region)
+
+                self.region_cache.put(region, state, dict_of_region)
+                loaded[region] = self._select(dict_of_region, columns)
+
+        # keep order of regions as was requested
+        for region in regions:
+            regions_data.append(loaded[region])
+
+        # mapped columns are returned without copy, columns of several regions are joined only as views
+        if self.mmap and regions_data and not dedup:
+            return self._concatenate_regions(regions_data, columns)
+
+        result_dict = self.merge_regions(regions_data, columns)
+
+        # duplicates across regions
+        if dedup:
+            sources = np.repeat(np.arange(len(regions)), [len(data["p1"]) for data in regions_data])
+            result_dict, self.duplicates_removed["merged"] = self.deduplicate(result_dict, sources=sources,
+                                                                               source_names=regions)
+            if requested is not None:
+                result_dict = self._select(result_dict, requested)
+
+        return result_dict
+
+    @instrument.instrumented("query")
+    def query(self, regions=None, columns=None, years=None, where=None):
+        # where is list of (column, operator, value), years is inclusive range, e.g. (2018, 2020)
+        predicates = make_predicates(where, years)
+
+        if regions is None:
+            regions = list(self.regions)
+        if columns is None:
+            columns = list(self.headers)
+
+        # regions are selected by name, other regions are never read
+        regions = [region for region in regions if region_matches(region, predicates)]
+        predicates = [predicate for predicate in predicates if predicate[0] != "region"]
+        needed = list(dict.fromkeys(list(columns) + [column for column, _, _ in predicates]))
+
+        state = self._archive_state()
+        regions_data = []
+        skipped = []
+
+        for region in dict.fromkeys(regions):
+            self._convert_legacy_cache(region)
+            cached = self.region_cache.cached_columns(region, state)
+
+            if all(column in cached for column in needed):
+                dict_of_region = self._filter_rows(cached, columns, predicates)
+
+            # only chunks, which can contain matching rows, are read from mapped column files
+            elif self.cache_format == "columns" and self._cache_valid(region, state):
+                dict_of_region = self._query_cache(region, columns, predicates)
+
+            # region is parsed (and cached) first
+            else:
+                dict_of_region = self._filter_rows(self.get_dict([region], columns=needed), columns, predicates)
+
+            if dict_of_region is not None:
+                regions_data.append(dict_of_region)
+            else:
+                skipped.append(region)
+
+        # empty result has the same types as stored columns
+        if not regions_data and skipped:
+            regions_data.append(self._query_cache(skipped[0], columns, [], np.array([], dtype=np.int64)))
+
+        return self.merge_regions(regions_data, columns)
+
+    def _cache_valid(self, region, state):
+        if not os.path.exists(self._cache_path(region)):
+            return False
+
+        # cache without manifest is used as it is
+        manifest = self._load_manifest(region)
+        return manifest is None or manifest == state
+
+    @staticmethod
+    def _filter_rows(dict_of_region, columns, predicates):
+        rows = len(next(iter(dict_of_region.values()), []))
+        selected = np.flatnonzero(row_mask(dict_of_region, predicates, rows))
+
+        return {key: take_rows(dict_of_region[key], selected) for key in columns}
+
+    def _query_cache(self, region, columns, predicates, selected=None):
+        path = self._cache_path(region)
+
+        # columns are mapped, so only touched parts are read (compressed columns are read whole)
+        with instrument.stage("query_cache", region=region) as record:
+            stats = stored_stats(path)
+            chunks = chunk_mask(stats, predicates)
+
+            # no chunk of region can contain matching row
+            if chunks is not None and not chunks.any():
+                return None
+
+            if predicates and selected is None:
+                filtered = load_columns(path, list(dict.fromkeys(column for column, _, _ in predicates)),
+                                        mmap_mode='r')
+                rows = len(next(iter(filtered.values())))
+
+                candidates = np.arange(rows) if chunks is None else chunk_rows_index(chunks, stats[0], rows)
+                filtered = {key: take_rows(values, candidates) for key, values in filtered.items()}
+                selected = candidates[row_mask(filtered, predicates, len(candidates))]
+
+                # other columns are not read at all
+                if not len(selected):
+                    return None
+
+            data = load_columns(path, columns, mmap_mode='r')
+            if selected is None:
+                selected = np.arange(len(next(iter(data.values()), [])))
+
+            dict_of_region = {key: take_rows(values, selected) for key, values in data.items()}
+            record.rows = len(selected)
+
+        return self._memory_format(dict_of_region)
+
+    def iter_chunks(self, regions=None, columns=None, chunk_rows=100000):
+        if regions is None:
+            regions = list(self.regions)
+
+        state = self._archive_state()
+
+        for region in regions:
+            self._convert_legacy_cache(region)
+            manifest = self._load_manifest(region) if os.path.exists(self._cache_path(region)) else None
+
+            # cache is read by parts, otherwise csv files are read by blocks of rows
+            if os.path.exists(self._cache_path(region)) and (manifest is None or manifest == state):
+                chunks = self._iter_cache_chunks(region, columns, chunk_rows)
+            else:
+                chunks = self._iter_csv_chunks(region, columns, chunk_rows)
+
+            for chunk in chunks:
+                yield chunk
+
+    def _iter_cache_chunks(self, region, columns, chunk_rows):
+        # raw columns in folder are mapped, so only one chunk is in memory (compressed ones are read whole)
+        if self.cache_format == "columns":
+            dict_of_region = load_columns(self._cache_path(region), columns, mmap_mode='r')
+            chunk_format = self._memory_format
+        else:
+            dict_of_region = self._load_cache(region, columns)
+            chunk_format = dict
+
+        rows = len(next(iter(dict_of_region.values()))) if dict_of_region else 0
+
+        for start in range(0, rows, chunk_rows):
+            yield chunk_format({key: self._copy_rows(values, start, start + chunk_rows)
+                                for key, values in dict_of_region.items()})
+
+    @staticmethod
+    def _copy_rows(values, start, stop):
+        if isinstance(values, EncodedColumn):
+            return EncodedColumn(np.array(values.codes[start:stop]), values.categories)
+
+        return np.array(values[start:stop])
+
+    def _iter_csv_chunks(self, region, columns, chunk_rows):
+        if not os.path.exists(self.folder) or len(os.listdir(self.folder)) == 0:
+            self.download_data()
+
+        # accidents (p1) from previous blocks, every block is checked only against this set
+        seen = set()
+        removed = dict()
+
+        for f, region_csv in self._open_region_csv(region, self._archives()):
+            while True:
+                block = b''.join(itertools.islice(region_csv, chunk_rows))
+                if not block:
+                    break
+
+                if not block.endswith(b'\n'):
+                    block += b'\n'
+
+                chunk = self._parse_region_columns(region, [block], [f])
+
+                # accidents from previous blocks are removed (block itself has no duplicates)
+                keys = chunk["p1"].tolist()
+                fresh = np.fromiter((key not in seen for key in keys), dtype=bool, count=len(keys))
+                seen.update(keys)
+
+                # duplicates of all blocks are counted, not only of the last one
+                removed[f] = removed.get(f, 0) + self.duplicates_removed[region].get(f, 0) + \
+                    int(np.count_nonzero(~fresh))
+                self.duplicates_removed[region] = dict(removed)
+
+                chunk = {key: values[fresh] for key, values in self._select(chunk, columns).items()}
+
+                if fresh.any():
+                    yield self._compact({region: chunk})[region]
+
+    def _concatenate_regions(self, regions_data, columns=None):
+        result_dict = dict()
+
+        for key in self.headers if columns is None else columns:
+            parts = [dict_of_region[key] for dict_of_region in regions_data]
+
+            # encoded columns have only small codes, they are merged as usual
+            if len(parts) == 1:
+                result_dict[key] = parts[0]
+            elif any(isinstance(part, EncodedColumn) for part in parts):
+                result_dict[key] = self._merge_regions(regions_data, [key])[key]
+            else:
+                result_dict[key] = ConcatenatedColumn(parts)
+
+        return result_dict
+
+    def merge_regions(self, regions_data, columns=None):
+        with instrument.stage("merge", regions=len(regions_data)) as record:
+            result_dict = self._merge_regions(regions_data, columns)
+            record.rows = len(next(iter(result_dict.values()), []))
+
+        return result_dict
+
+    def _merge_regions(self, regions_data, columns=None):
+        result_dict = dict()
+
+        for key in self.headers if columns is None else columns:
+            index = self.headers.index(key)
+            columns_data = [dict_of_region[key] for dict_of_region in regions_data]
+
+            # parts can come from caches in different formats
+            encoded = [isinstance(column, EncodedColumn) for column in columns_data]
+            if any(encoded) and not all(encoded):
+                if self.compact:
+                    columns_data = [column if is_encoded else EncodedColumn.encode(column)
+                                    for column, is_encoded in zip(columns_data, encoded)]
+                else:
+                    columns_data = [column.decode() if is_encoded else column
+                                    for column, is_encoded in zip(columns_data, encoded)]
+
+            if columns_data and isinstance(columns_data[0], EncodedColumn):
+                result_dict[key] = EncodedColumn.concatenate(columns_data)
+                continue
+
+            # size of output column is known, so it is allocated only once
+            dtypes = [column.dtype for column in columns_data]
+            if not self.compact or not dtypes:
+                dtypes.append(np.dtype(self.headers_type[index]))
+
+            dtype = np.result_type(*dtypes)
+            merged = np.empty(sum(len(column) for column in columns_data), dtype=dtype)
+
+            position = 0
+            for column in columns_data:
+                merged[position:position + len(column)] = column
+                position += len(column)
+
+            result_dict[key] = merged
+
+        return result_dict
 
 
 if __name__ == "__main__":
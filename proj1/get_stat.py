@@ -9,58 +9,107 @@ import argparse
 import os
 
 from download import DataDownloader
+from compact import EncodedColumn
+import instrument
+
+# codes of p24 in order of rows of figure, "Zadna uprava" (0) is the last one, missing values (-1) are not shown
+ACCIDENT_TYPES = [1, 2, 3, 4, 5, 0]
 
 
 def plot_stat(data_source,
               fig_location=None,
               show_figure=False):
 
+    regions, absolut_data, relative_data = stat_tables(data_source)
+
+    draw_stat(regions, absolut_data, relative_data, fig_location, show_figure)
+
+
+def plot_stat_stream(chunks,
+                     fig_location=None,
+                     show_figure=False):
+
+    regions, absolut_data, relative_data = stat_tables_stream(chunks)
+
+    draw_stat(regions, absolut_data, relative_data, fig_location, show_figure)
+
+
+def crosstab(data, row_key, col_key):
+    row_labels, rows = unique_inverse(data[row_key])
+    col_labels, cols = unique_inverse(data[col_key])
+
+    # count of every pair of values in one pass through data
+    absolute = np.bincount(rows * len(col_labels) + cols, minlength=len(row_labels) * len(col_labels))
+    absolute = absolute.reshape(len(row_labels), len(col_labels))
+
+    return row_labels, col_labels, absolute, to_percentage(absolute)
+
+
+def unique_inverse(values):
+    # encoded column has sorted table of values, so only its codes are needed
+    if isinstance(values, EncodedColumn):
+        codes, inverse = np.unique(values.codes, return_inverse=True)
+        return values.categories[codes], inverse.ravel()
+
+    labels, inverse = np.unique(np.asarray(values), return_inverse=True)
+    return labels, inverse.ravel()
+
+
+def to_percentage(absolute):
+    # count of accident in every row (for one of cause)
+    counter = absolute.sum(axis=1, keepdims=True)
+
+    # convert number into percentages, zero count is not shown
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(absolute == 0, np.nan, absolute / counter * 100)
+
+
+@instrument.instrumented("stat_tables")
+def stat_tables(data_source):
+    # type of accident in numeric value (column p24) against regions
+    accident_types, regions, absolut_data, _ = crosstab(data_source, "p24", "region")
+
+    absolut_data = type_rows(accident_types, absolut_data)
+    return regions, absolut_data, to_percentage(absolut_data)
+
+
+def type_rows(accident_types, absolute):
+    # one row for every type in ACCIDENT_TYPES, types without accidents have zeros
+    rows = np.zeros((len(ACCIDENT_TYPES), absolute.shape[1]), dtype=absolute.dtype)
+
+    for row, accident_type in enumerate(ACCIDENT_TYPES):
+        found = np.flatnonzero(accident_types == accident_type)
+        if len(found):
+            rows[row] = absolute[found[0]]
+
+    return rows
+
+
+@instrument.instrumented("stat_tables")
+def stat_tables_stream(chunks):
+    counts = dict()
+
+    # running count of accidents for every pair of type and region, only one chunk is in memory
+    for chunk in chunks:
+        accident_types, regions, absolute, _ = crosstab(chunk, "p24", "region")
+
+        for i, cause in enumerate(accident_types):
+            for j, region in enumerate(regions):
+                counts[(cause, region)] = counts.get((cause, region), 0) + int(absolute[i, j])
+
+    regions = np.array(sorted({region for _, region in counts}))
+
+    absolut_data = np.array([[counts.get((cause, region), 0) for region in regions]
+                             for cause in ACCIDENT_TYPES]).reshape(len(ACCIDENT_TYPES), len(regions))
+
+    return regions, absolut_data, to_percentage(absolut_data)
+
+
+@instrument.instrumented("draw_stat")
+def draw_stat(regions, absolut_data, relative_data, fig_location=None, show_figure=False):
     accident_cause = ["Přerušovaná žlutá", "Semafor mimo provoz", 
                       "Dopravními značky", "Přenosné dopravní značky", "Nevyznačena", "Žádná úprava"]
 
-    # get type of regions from data_source
-    regions = np.unique(data_source["region"])
-    
-    # type of accident in numeric value (column p24)
-    accident_types = np.unique(data_source["p24"])
-
-    # array for count of accident
-    absolut_data = []
-    relative_data = []
-
-    # iterate through types of accident
-    for cause in range(len(accident_types)):
-        tmp_arr = []
-        arr_in_percentage = []
-        counter = 0
-
-        # iterate through regions
-        for curr_reg in range(len(regions)):
-            x = np.argwhere((data_source["region"] == regions[curr_reg]) & (data_source["p24"] == cause))
-            
-            tmp_arr.append(len(x))
-            
-            # count of accident for one of cause
-            counter += len(x)
-
-        absolut_data.append(tmp_arr)
-
-        # convert number into percentages 
-        for num in tmp_arr:
-            if num == 0:
-                arr_in_percentage.append(np.nan)
-            else:
-                arr_in_percentage.append(num / counter * 100)
-        
-        relative_data.append(arr_in_percentage)
-
-    # put "Zadna uprava" to end of array 
-    relative_data.append(relative_data[0])
-    relative_data.remove(relative_data[0])
-
-    absolut_data.append(absolut_data[0])
-    absolut_data.remove(absolut_data[0])
-
     fig, ax = plt.subplots(2)
     fig.set_figheight(8.27)
     fig.set_figwidth(11.69)
@@ -116,9 +165,15 @@ if __name__ == "__main__":
 
     arg_parser.add_argument("--fig_location", help="Path for store figure")
     arg_parser.add_argument("--show_figure", action="store_true", help="Show figure in pop-up window")
+    arg_parser.add_argument("--chunk_rows", type=int, help="Count accidents by chunks of rows")
+    instrument.add_argument(arg_parser)
 
     args = arg_parser.parse_args()
-
-    data_source = DataDownloader().get_dict()
-
-    plot_stat(data_source, fig_location=args.fig_location, show_figure=args.show_figure)
+    instrument.configure_from_args(args)
+
+    if args.chunk_rows:
+        chunks = DataDownloader().iter_chunks(columns=["region", "p24"], chunk_rows=args.chunk_rows)
+        plot_stat_stream(chunks, fig_location=args.fig_location, show_figure=args.show_figure)
+    else:
+        data_source = DataDownloader().get_dict(columns=["region", "p24"])
+        plot_stat(data_source, fig_location=args.fig_location, show_figure=args.show_figure)
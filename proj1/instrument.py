@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+# resource is available only on Unix, peak resident memory is not recorded elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# instrumentation is switched on by IZV_PROFILE (or --profile of scripts), value is list of modes
+# separated by ",": "json" writes record of every stage, "tracemalloc" adds peak of allocated memory
+# and "cprofile" stores profile of every outermost stage into .prof file
+ENV_MODES = "IZV_PROFILE"
+ENV_LOG = "IZV_PROFILE_LOG"
+
+DEFAULT_LOG = "profile.jsonl"
+MODES = ["json", "tracemalloc", "cprofile"]
+
+_modes = set()
+_log_path = DEFAULT_LOG
+_depth = 0
+# highest peaks of open stages, peak of tracemalloc is reset by every stage
+_peaks = []
+
+
+def configure(modes=None, log_path=None):
+    global _modes, _log_path
+
+    if modes is None:
+        modes = os.environ.get(ENV_MODES, "")
+    if isinstance(modes, str):
+        modes = [mode for mode in modes.split(",") if mode]
+
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise ValueError("unknown profile modes: {}".format(", ".join(unknown)))
+
+    # every enabled mode writes its records
+    _modes = set(modes)
+    if _modes:
+        _modes.add("json")
+
+    _log_path = log_path or os.environ.get(ENV_LOG, DEFAULT_LOG)
+
+    # child processes (process pools) read configuration from environment
+    if _modes:
+        os.environ[ENV_MODES] = ",".join(sorted(_modes))
+        os.environ[ENV_LOG] = os.path.abspath(_log_path)
+    else:
+        os.environ.pop(ENV_MODES, None)
+
+
+def enabled():
+    return bool(_modes)
+
+
+class Stage:
+    def __init__(self, name, rows=None, **fields):
+        self.name = name
+        # counters can be set inside of measured block
+        self.rows = rows
+        self.bytes_read = None
+        self.bytes_written = None
+        self.fields = fields
+
+        self._profile = None
+
+    def __enter__(self):
+        global _depth
+
+        self._outermost = _depth == 0
+        _depth += 1
+
+        if "tracemalloc" in _modes:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            # peak of outer stage until now is kept before reset
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+            _peaks.append(0)
+            tracemalloc.reset_peak()
+
+        # profiler can not be nested, so only outermost stage is profiled
+        if "cprofile" in _modes and self._outermost:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        global _depth
+
+        duration = time.perf_counter() - self._start
+        _depth -= 1
+
+        record = {"stage": self.name, "pid": os.getpid(), "time": duration, "rows": self.rows,
+                  "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                  "error": exc_type.__name__ if exc_type is not None else None}
+        record.update(self.fields)
+
+        # peak resident memory of whole process until end of stage (kB on Linux)
+        if resource is not None:
+            record["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if "tracemalloc" in _modes:
+            peak = max(tracemalloc.get_traced_memory()[1], _peaks.pop())
+            record["peak_bytes"] = peak
+
+            # peak of outer stage includes peak of this one
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+
+        if self._profile is not None:
+            self._profile.disable()
+            record["profile"] = "{}.{}.{}.prof".format(os.path.splitext(_log_path)[0], self.name, os.getpid())
+            self._profile.dump_stats(record["profile"])
+
+        with open(_log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        return False
+
+
+class _NoStage:
+    # shared object for disabled instrumentation, counters are ignored
+    rows = None
+    bytes_read = None
+    bytes_written = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, rows=None, **fields):
+    if not _modes:
+        return _NO_STAGE
+
+    return Stage(name, rows, **fields)
+
+
+def instrumented(name):
+    # decorator for whole function, rows are not known
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _modes:
+                return function(*args, **kwargs)
+
+            with Stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_argument(arg_parser):
+    arg_parser.add_argument("--profile", nargs="?", const="json", metavar="MODES",
+                            help="Record stages into {} (modes: {})".format(DEFAULT_LOG, ", ".join(MODES)))
+    arg_parser.add_argument("--profile_log", help="Path of file with records of stages")
+
+
+def configure_from_args(args):
+    configure(args.profile, args.profile_log)
+
+
+def summary(log_path=DEFAULT_LOG):
+    # total time, rows and count of calls for every stage in log
+    totals = dict()
+
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            total = totals.setdefault(record["stage"], {"calls": 0, "time": 0.0, "rows": 0})
+
+            total["calls"] += 1
+            total["time"] += record["time"]
+            total["rows"] += record["rows"] or 0
+
+    return totals
+
+
+configure()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Summary of records of stages")
+    arg_parser.add_argument("log", nargs="?", default=DEFAULT_LOG)
+
+    args = arg_parser.parse_args()
+
+    print("{:<24}{:>8}{:>12}{:>12}".format("stage", "calls", "time [s]", "rows"))
+    for name, total in sorted(summary(args.log).items(), key=lambda item: -item[1]["time"]):
+        print("{:<24}{:>8}{:>12.3f}{:>12}".format(name, total["calls"], total["time"], total["rows"]))
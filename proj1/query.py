@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import operator
+
+from compact import EncodedColumn
+
+# predicate is (column, operator, value), all predicates of query have to be true
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+             ">": operator.gt, ">=": operator.ge, "in": lambda values, value: np.isin(values, value)}
+
+
+def make_predicates(where=None, years=None):
+    predicates = []
+
+    for column, op, value in where or []:
+        if op not in OPERATORS:
+            raise ValueError("unknown operator {}, known are {}".format(op, ", ".join(OPERATORS)))
+
+        predicates.append((column, op, list(value) if op == "in" else value))
+
+    # range of years (inclusive) is range of dates
+    if years is not None:
+        first, last = years
+        predicates.append(("p2a", ">=", np.datetime64("{:04d}-01-01".format(first))))
+        predicates.append(("p2a", "<", np.datetime64("{:04d}-01-01".format(last + 1))))
+
+    return predicates
+
+
+def cast_value(value, dtype):
+    # dates can be given as strings or datetime64 with other unit
+    if dtype.kind == "M":
+        return np.asarray(value, dtype=dtype)
+
+    return np.asarray(value)
+
+
+def evaluate(values, op, value):
+    # predicate of encoded column is evaluated only on table of values
+    if isinstance(values, EncodedColumn):
+        return evaluate(values.categories, op, value)[values.codes]
+
+    values = np.asarray(values)
+    return np.asarray(OPERATORS[op](values, cast_value(value, values.dtype)), dtype=bool)
+
+
+def row_mask(dict_of_data, predicates, rows):
+    mask = np.ones(rows, dtype=bool)
+
+    for column, op, value in predicates:
+        mask = mask & evaluate(dict_of_data[column], op, value)
+
+    return mask
+
+
+def region_matches(region, predicates):
+    # predicates on column region are decided before anything is loaded
+    return all(evaluate(np.array([region]), op, value)[0] for column, op, value in predicates
+               if column == "region")
+
+
+def chunk_matches(minimum, maximum, op, value):
+    # chunks, which can contain matching rows, from minimum and maximum of every chunk
+    value = cast_value(value, minimum.dtype)
+
+    if op == "==":
+        return (minimum <= value) & (value <= maximum)
+    if op == "!=":
+        return ~((minimum == value) & (maximum == value))
+    if op == "<":
+        return minimum < value
+    if op == "<=":
+        return minimum <= value
+    if op == ">":
+        return maximum > value
+    if op == ">=":
+        return maximum >= value
+
+    matches = np.zeros(len(minimum), dtype=bool)
+    for item in value.ravel():
+        matches |= (minimum <= item) & (item <= maximum)
+
+    return matches
+
+
+def chunk_mask(stats, predicates):
+    # stats are (rows in chunk, {column: (minimum, maximum)}) or None, when they were not stored
+    if stats is None:
+        return None
+
+    chunk_rows, columns = stats
+    mask = None
+
+    for column, op, value in predicates:
+        if column not in columns:
+            continue
+
+        matches = chunk_matches(*columns[column], op, value)
+        mask = matches if mask is None else mask & matches
+
+    return mask
+
+
+def chunk_rows_index(mask, chunk_rows, rows):
+    # indexes of all rows in chunks, which are not skipped
+    starts = np.flatnonzero(mask) * chunk_rows
+    if not len(starts):
+        return np.array([], dtype=np.int64)
+
+    return np.concatenate([np.arange(start, min(start + chunk_rows, rows)) for start in starts])
+
+
+def take_rows(values, rows):
+    # selected rows are copied, mapped file is not needed by result
+    if isinstance(values, EncodedColumn):
+        return EncodedColumn(np.asarray(values.codes)[rows], values.categories)
+
+    return np.asarray(values)[rows]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from collections import OrderedDict
+
+from compact import EncodedColumn
+
+# memory for regions kept by one DataDownloader
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def heap_bytes(values):
+    # mapped columns are in page cache of system, only arrays in memory of process are counted
+    if isinstance(values, EncodedColumn):
+        return heap_bytes(values.codes) + heap_bytes(values.categories)
+
+    if isinstance(values, np.memmap):
+        return 0
+
+    return np.asarray(values).nbytes
+
+
+class RegionCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+        # region: (state of ZIP files, columns, all columns are present)
+        self.regions = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, region):
+        return region in self.regions
+
+    def __len__(self):
+        return len(self.regions)
+
+    def get(self, region, state, columns=None):
+        entry = self.regions.get(region)
+
+        # region is usable only when it was read from the same ZIP files and has all requested columns
+        if entry is None or entry[0] != state or \
+                (not entry[2] if columns is None else any(key not in entry[1] for key in columns)):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.regions.move_to_end(region)
+
+        if columns is None:
+            return dict(entry[1])
+
+        return {key: entry[1][key] for key in columns}
+
+    def cached_columns(self, region, state):
+        # columns, which do not have to be read from disk again
+        entry = self.regions.get(region)
+        if entry is None or entry[0] != state:
+            return dict()
+
+        return entry[1]
+
+    def put(self, region, state, dict_of_region, complete=True):
+        entry = self.regions.get(region)
+
+        # columns read later are added to columns of the same state
+        if entry is not None and entry[0] == state:
+            dict_of_region = {**entry[1], **dict_of_region}
+            complete = complete or entry[2]
+
+        self.discard(region)
+
+        self.regions[region] = (state, dict(dict_of_region), complete)
+        self.nbytes += sum(heap_bytes(values) for values in dict_of_region.values())
+
+        # least recently used regions are dropped, the new one is always kept
+        while self.nbytes > self.max_bytes and len(self.regions) > 1:
+            _, (_, evicted, _) = self.regions.popitem(last=False)
+            self.nbytes -= sum(heap_bytes(values) for values in evicted.values())
+            self.evictions += 1
+
+    def discard(self, region):
+        entry = self.regions.pop(region, None)
+
+        if entry is not None:
+            self.nbytes -= sum(heap_bytes(values) for values in entry[1].values())
+
+    def clear(self):
+        self.regions.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {"regions": list(self.regions), "nbytes": self.nbytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
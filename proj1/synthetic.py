@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import argparse
+import csv
+import io
+import os
+import zipfile
+
+from download import DataDownloader
+
+# ranges of integer columns (inclusive), other integer columns are from 0 to 9
+INTEGER_RANGES = {
+    "p36": (0, 8), "weekday(p2a)": (0, 6), "p2b": (0, 2359), "p6": (0, 9), "p7": (0, 4), "p8": (0, 9),
+    "p9": (1, 2), "p10": (0, 7), "p11": (0, 9), "p13a": (0, 2), "p13b": (0, 3), "p13c": (0, 5),
+    "p14": (0, 5000), "p15": (1, 6), "p16": (0, 8), "p17": (0, 6), "p18": (0, 7), "p19": (0, 7),
+    "p20": (0, 6), "p21": (0, 6), "p22": (0, 5), "p23": (0, 5), "p24": (0, 5), "p34": (0, 10),
+    "p53": (0, 5000), "p58": (0, 9), "p5a": (1, 2),
+}
+
+# codes of causes of accident (p12)
+CAUSES = np.concatenate([[100], np.arange(201, 210), np.arange(301, 312), np.arange(401, 415),
+                         np.arange(501, 517), np.arange(601, 616)])
+
+# text values with characters, which are specific for cp1250
+TEXTS = ["Brno-Žabovřesky", "Praha", "Ústí nad Labem", "České Budějovice", "Zlín", "Jihlava",
+         "Plzeň", "Olomouc", "Liberec", "Hradec Králové", "Pardubice", "Ostrava", "Karlovy Vary", ""]
+
+# area of every region in EPSG:5514, coordinates are around its center
+REGION_CENTERS = {
+    "PHA": (-742000, -1045000), "STC": (-720000, -1060000), "JHC": (-760000, -1160000),
+    "PLK": (-830000, -1080000), "ULK": (-760000, -980000), "HKK": (-630000, -1020000),
+    "JHM": (-590000, -1170000), "MSK": (-470000, -1110000), "OLK": (-540000, -1110000),
+    "ZLK": (-520000, -1170000), "VYS": (-640000, -1130000), "PAK": (-620000, -1070000),
+    "LBK": (-690000, -990000), "KVK": (-860000, -1020000),
+}
+
+
+def generate_region(rng, region, year, rows, blank_rate=0.03, xx_rate=0.02):
+    # values of all 64 columns of csv (region is added by parser)
+    columns = []
+    dates = np.datetime64("{}-01-01".format(year)) + rng.integers(0, 365, rows)
+    center = REGION_CENTERS[region]
+
+    for name, dtype in zip(DataDownloader.headers[:-1], DataDownloader.headers_type[:-1]):
+        if name == "p1":
+            # unique identifier of accident: region, year and number
+            values = np.char.add("{}{:02d}".format(DataDownloader.regions[region], year % 100),
+                                 np.char.zfill(np.arange(rows).astype("U"), 8))
+        elif name == "p2a":
+            values = dates.astype("U")
+        elif name == "weekday(p2a)":
+            values = ((dates.astype(np.int64) + 4) % 7).astype("U")
+        elif name == "p12":
+            values = rng.choice(CAUSES, rows).astype("U")
+        elif name == "p13a":
+            # most of accidents are without death
+            values = rng.choice([0, 0, 0, 0, 0, 0, 0, 0, 1, 2], rows).astype("U")
+        elif dtype == "i":
+            low, high = INTEGER_RANGES.get(name, (0, 9))
+            values = rng.integers(low, high + 1, rows).astype("U")
+        elif dtype == "f":
+            if name in ("d", "e"):
+                values = (center[0] if name == "d" else center[1]) + rng.normal(0, 20000, rows)
+            else:
+                values = rng.uniform(-1000000, 0, rows)
+            # decimal comma like in real data
+            values = np.char.replace(np.round(values, 2).astype("U"), ".", ",")
+        else:
+            values = rng.choice(TEXTS, rows)
+
+        # missing values, identifiers and dates are always filled
+        if name not in ("p1", "p2a"):
+            mark = rng.random(rows)
+            values = np.where(mark < blank_rate, "", values)
+            values = np.where((mark >= blank_rate) & (mark < blank_rate + xx_rate), "XX", values)
+
+        columns.append(values)
+
+    return columns
+
+
+def add_duplicates(rng, columns, previous, duplicate_rate):
+    # some rows are replaced by copy of accident from previous year (or from this file)
+    rows = len(columns[0])
+    count = int(round(rows * duplicate_rate))
+
+    if count == 0 or rows == 0:
+        return columns
+
+    targets = rng.choice(rows, count, replace=False)
+    # objects, so copied values are never cut to width of other string array
+    columns = [values.astype(object) for values in columns]
+
+    if previous is not None and len(previous[0]):
+        sources = rng.integers(0, len(previous[0]), count)
+        for values, old in zip(columns, previous):
+            values[targets] = old[sources]
+    else:
+        # copy of earlier row of the same file
+        targets = targets[targets > 0]
+        sources = (rng.random(len(targets)) * targets).astype(np.int64)
+        for values in columns:
+            values[targets] = values[sources]
+
+    return columns
+
+
+def region_csv(columns):
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\r\n")
+    writer.writerows(zip(*[values.tolist() for values in columns]))
+
+    return output.getvalue().encode("cp1250")
+
+
+def generate(folder, rows=1000, years=(2016, 2017, 2018, 2019, 2020), duplicate_rate=0.01,
+             blank_rate=0.03, xx_rate=0.02, seed=0):
+    # writes data_<year>.zip in the same layout as downloaded archives, rows are per region and year
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    previous = dict()
+    paths = []
+
+    for year in years:
+        path = os.path.join(folder, "data_{}.zip".format(year))
+
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for region, code in DataDownloader.regions.items():
+                columns = generate_region(rng, region, year, rows, blank_rate, xx_rate)
+                columns = add_duplicates(rng, columns, previous.get(region), duplicate_rate)
+                previous[region] = columns
+
+                zip_file.writestr(code + ".csv", region_csv(columns))
+
+        paths.append(path)
+
+    return paths
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic ZIP files with accidents")
+
+    arg_parser.add_argument("folder", help="Output folder")
+    arg_parser.add_argument("--rows", type=int, default=1000, help="Rows per region and year")
+    arg_parser.add_argument("--years", type=int, nargs="+", default=[2016, 2017, 2018, 2019, 2020])
+    arg_parser.add_argument("--duplicates", type=float, default=0.01, help="Rate of duplicate accidents")
+    arg_parser.add_argument("--blanks", type=float, default=0.03, help="Rate of empty values")
+    arg_parser.add_argument("--xx", type=float, default=0.02, help="Rate of XX values")
+    arg_parser.add_argument("--seed", type=int, default=0)
+
+    args = arg_parser.parse_args()
+
+    for path in generate(args.folder, args.rows, args.years, args.duplicates, args.blanks, args.xx, args.seed):
+        print(path)
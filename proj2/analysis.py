@@ -5,18 +5,37 @@ import pandas as pd
 import seaborn as sns
 import numpy as np
 import os
-
-
-def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
-    df = pd.read_pickle(filename)
-
-    # columns for category
-    category_cols = ['p36', 'p5a', 'weekday(p2a)', 'p6', 'p7', 'p8', 'p9', 'p10',
-                     'p11', 'p12', 'p13a', 'p13b', 'p13c', 'p15', 'p16', 'p17',
-                     'p18', 'p19', 'p20', 'p21', 'p22', 'p23', 'p24', 'p27',
-                     'p28', 'p34', 'p35', 'p39', 'p44', 'p45a', 'p47', 'p48a',
-                     'p49', 'p50a', 'p50b', 'p51', 'p52', 'p53', 'p55a', 'p57',
-                     'p58', 'j', 'o', 'p', 't']
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj1'))
+from columnar import is_column_store, load_columns  # noqa: E402
+from compact import EncodedColumn  # noqa: E402
+from cube import MonthlyCube  # noqa: E402
+from derived import derived_columns  # noqa: E402
+import instrument  # noqa: E402
+
+# columns for category
+CATEGORY_COLUMNS = ['p36', 'p5a', 'weekday(p2a)', 'p6', 'p7', 'p8', 'p9', 'p10',
+                    'p11', 'p12', 'p13a', 'p13b', 'p13c', 'p15', 'p16', 'p17',
+                    'p18', 'p19', 'p20', 'p21', 'p22', 'p23', 'p24', 'p27',
+                    'p28', 'p34', 'p35', 'p39', 'p44', 'p45a', 'p47', 'p48a',
+                    'p49', 'p50a', 'p50b', 'p51', 'p52', 'p53', 'p55a', 'p57',
+                    'p58', 'j', 'o', 'p', 't']
+
+
+@instrument.instrumented('get_dataframe')
+def get_dataframe(filename: str, verbose: bool = False,
+                  columns: list = None) -> pd.DataFrame:
+    # folder with column files is read only partially
+    if is_column_store(filename):
+        df = pd.DataFrame({name: pd.Categorical.from_codes(values.codes, values.categories)
+                           if isinstance(values, EncodedColumn) else values
+                           for name, values in load_columns(filename, columns).items()})
+    else:
+        df = pd.read_pickle(filename)
+
+        if columns is not None:
+            df = df[columns]
 
     if verbose:
         orig_size = df.memory_usage(deep=True).sum() / 1048576
@@ -27,8 +46,8 @@ def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
     # change data type
     for col in df.columns:
         if col == 'date':
-            df[col] = df[col].astype('datetime64')
-        elif col in category_cols:
+            df[col] = df[col].astype('datetime64[ns]')
+        elif col in CATEGORY_COLUMNS:
             df[col] = df[col].astype('category')
 
     # print memory usage 
@@ -40,31 +59,132 @@ def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
     return df
 
 
-def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
-                  show_figure: bool = False):
+@instrument.instrumented('load_dataframe')
+def load_dataframe(source, verbose: bool = False,
+                   columns: list = None) -> pd.DataFrame:
+    # source is folder with column files or dictionary from DataDownloader.get_dict
+    if isinstance(source, str):
+        source = load_columns(source, columns)
+    elif columns is not None:
+        source = {col: source[col] for col in columns}
+
+    data = dict()
+    for col, values in source.items():
+        # rename column 'p2a' to 'date'
+        if col == 'p2a':
+            data['date'] = np.asarray(values).astype('datetime64[ns]')
+        elif isinstance(values, EncodedColumn):
+            data[col] = pd.Categorical.from_codes(values.codes, values.categories)
+        elif col in CATEGORY_COLUMNS:
+            # codes are computed once, without copy of whole column
+            codes, categories = pd.factorize(np.asarray(values), sort=True)
+            data[col] = pd.Categorical.from_codes(codes, categories)
+        else:
+            # mapped columns stay mapped, columns joined from several regions are copied here
+            data[col] = np.asarray(values)
 
-    fig, ((ax1, ax2, ax3), (ax4, ax5, ax6)) = plt.subplots(2, 3, figsize=(8.27, 8.27))
-    # tmp array of axes 
-    axs = [ax1, ax2, ax3, ax4, ax5, ax6]
-    # tmp array from title labels
-    headers = ['dvoupruhová komunikace', 'třípruhová komunikace',
-               'čtyřpruhová komunikace', 'vícepruhová komunika',
-               'rychlostní komunikace', 'jiná komunikace']
+    df = pd.DataFrame(data, copy=False)
 
-    df = df[['p21', 'region']].set_index('region')
-    df = df.loc[['JHM', 'PHA', 'STC', 'VYS']].reset_index()
+    # print memory usage, without walking through strings
+    if verbose:
+        orig_size = sum(np.asarray(values).nbytes if not isinstance(values, EncodedColumn) else values.nbytes
+                        for values in source.values()) / 1048576
+        new_size = df.memory_usage(deep=False).sum() / 1048576
+        print(f"orig_size={orig_size:.1f} MB")
+        print(f"new_size={new_size:.1f} MB")
 
-    # column for easy count of accident
-    df['tmp'] = 1
+    return df
+
+
+def as_cube(df) -> MonthlyCube:
+    # plots accept DataFrame or already built (or loaded) cube
+    if isinstance(df, MonthlyCube):
+        return df
+
+    return MonthlyCube.build(df)
 
-    df = pd.pivot_table(df, columns='p21', values='tmp', index='region', aggfunc="sum")
+
+@instrument.instrumented('roadtype_table')
+def roadtype_table(cube: MonthlyCube) -> pd.DataFrame:
+    df = cube.select(['JHM', 'PHA', 'STC', 'VYS'])
+
+    df = pd.pivot_table(df, columns='p21', values='count', index='region', aggfunc="sum")
 
     # add columns 3 and 4
     df[3] = df[3] + df[4]
     # delete 4th column
     df = df.drop(columns=4)
     # switch first and last column 
-    df = df[[1, 2, 3, 5, 6, 0]]
+    return df[[1, 2, 3, 5, 6, 0]]
+
+
+@instrument.instrumented('animals_table')
+def animals_table(cube: MonthlyCube) -> pd.DataFrame:
+    # year, month and labels are computed once for the cube and reused by next calls
+    df = cube.frame
+    derived = derived_columns(df)
+
+    mask = (df['region'].isin(['PHA', 'JHM', 'STC', 'VYS']) & (df['p58'] == 5)).to_numpy()
+    mask = mask & (derived['year'] != 2021)
+
+    df = pd.DataFrame({'region': df['region'].to_numpy()[mask],
+                       'month': derived['month'][mask],
+                       'p10': derived['p10_label'][mask],
+                       'count': df['count'].to_numpy()[mask]})
+
+    df = df.groupby(['region', 'month', 'p10'])['count'].sum()
+    return df.reset_index(name='tmp')
+
+
+@instrument.instrumented('conditions_table')
+def conditions_table(cube: MonthlyCube) -> pd.DataFrame:
+    df = cube.frame
+    derived = derived_columns(df)
+
+    mask = (df['region'].isin(['PHA', 'JHM', 'STC', 'VYS']) & (df['p18'] != 0)).to_numpy()
+    mask = mask & (derived['year'] != 2021)
+
+    df = pd.DataFrame({'region': df['region'].to_numpy()[mask],
+                       'month': df['date'].to_numpy()[mask],
+                       'p18': derived['p18_label'][mask],
+                       'count': df['count'].to_numpy()[mask]})
+
+    df = pd.pivot_table(df, columns='p18', values='count', index=['region', 'month'],
+                        aggfunc='sum', fill_value=0)
+
+    # months without accidents are kept with zero, every region has continuous range of months
+    index = []
+    for region, months in df.reset_index('month')['month'].groupby(level=0):
+        months = months.to_numpy().astype('datetime64[M]')
+        index += [(region, month) for month in np.arange(months.min(), months.max() + 1)]
+
+    df = df.reindex(pd.MultiIndex.from_tuples(index, names=['region', 'month']), fill_value=0)
+
+    # months are labeled by their last day
+    months = df.index.get_level_values('month').to_numpy().astype('datetime64[M]')
+    df['date'] = ((months + 1).astype('datetime64[D]') - 1).astype('datetime64[ns]')
+    df = df.reset_index('month', drop=True).set_index('date', append=True)
+
+    df = df.stack()
+    return df.reset_index()
+
+
+def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
+                  show_figure: bool = False):
+    draw_roadtype(roadtype_table(as_cube(df)), fig_location, show_figure)
+
+
+@instrument.instrumented('draw_roadtype')
+def draw_roadtype(df: pd.DataFrame, fig_location: str = None,
+                  show_figure: bool = False):
+
+    fig, ((ax1, ax2, ax3), (ax4, ax5, ax6)) = plt.subplots(2, 3, figsize=(8.27, 8.27))
+    # tmp array of axes 
+    axs = [ax1, ax2, ax3, ax4, ax5, ax6]
+    # tmp array from title labels
+    headers = ['dvoupruhová komunikace', 'třípruhová komunikace',
+               'čtyřpruhová komunikace', 'vícepruhová komunika',
+               'rychlostní komunikace', 'jiná komunikace']
 
     fig.suptitle('Druhy silnic')
     sns.set_theme(style='white', palette='pastel')
@@ -104,30 +224,12 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
 
 def plot_animals(df: pd.DataFrame, fig_location: str = None,
                  show_figure: bool = False):
+    draw_animals(animals_table(as_cube(df)), fig_location, show_figure)
 
-    df = df[['p58', 'p10', 'date', 'region']].set_index('region')
-    df = df.loc[['PHA', 'JHM', 'STC', 'VYS']].reset_index()
-    df = df[df['p58'] == 5]
-
-    # extracting year and month from DataTime
-    df['year'] = df['date'].dt.year
-    df['month'] = df['date'].dt.month
-    # make tmp column for counting value
-    df['tmp'] = 1
-
-    df = df[df['year'] != 2021]
-    df = df.drop(columns=['date', 'year', 'p58'])
 
-    df = df.set_index('p10')
-    # rename index for better visualization
-    df = df.rename(index={1: 'řidičem', 2: 'řidičem', 3: 'jiné',
-                          4: 'zvěří', 5: 'jiné', 6: 'jiné',
-                          7: 'jiné', 0: 'jiné'
-                          })
-
-    df = df.reset_index()
-    df = df.groupby(['region', 'month', 'p10']).agg('count')
-    df = df.reset_index()
+@instrument.instrumented('draw_animals')
+def draw_animals(df: pd.DataFrame, fig_location: str = None,
+                 show_figure: bool = False):
 
     sns.set_theme(style='darkgrid', palette='pastel')
     g = sns.catplot(x='month', y='tmp', col='region', data=df,
@@ -155,26 +257,12 @@ def plot_animals(df: pd.DataFrame, fig_location: str = None,
 
 def plot_conditions(df: pd.DataFrame, fig_location: str = None,
                     show_figure: bool = False):
+    draw_conditions(conditions_table(as_cube(df)), fig_location, show_figure)
 
-    df = df[['p18', 'date', 'region']].set_index('region')
-    df = df.loc[['PHA', 'JHM', 'STC', 'VYS']].reset_index()
-    df = df[df['p18'] != 0]
-    df = df[df['date'].dt.year != 2021]
-    # make tmp column for counting value
-    df['tmp'] = 1
-
-    df = df.set_index('p18')
-    # rename index for better visualization
-    df = df.rename({1: 'neztížené', 2: 'mlha', 3: 'na počátku deště',
-                    4: 'déšť', 5: 'sněžení', 6: 'náledí',
-                    7: 'vítr'}).reset_index()
-
-    df = pd.pivot_table(df, columns=['p18'], values='tmp', index=['date', 'region'], aggfunc='sum')
-    df = df.reset_index().set_index('date')
-    df = df.groupby('region').resample('M').sum()
 
-    df = df.stack()
-    df = df.reset_index()
+@instrument.instrumented('draw_conditions')
+def draw_conditions(df: pd.DataFrame, fig_location: str = None,
+                    show_figure: bool = False):
 
     facet_kws = {'sharey': False, 'sharex': False}
     sns.set_theme(style='darkgrid', palette='pastel')
@@ -205,8 +293,14 @@ def plot_conditions(df: pd.DataFrame, fig_location: str = None,
 
 
 if __name__ == "__main__":
-    dataframe = get_dataframe("accidents.pkl.gz", verbose=True)
-
-    # plot_roadtype(df, fig_location="01_roadtype.png", show_figure=True)
-    # plot_animals(df, "02_animals.png", True)
-    plot_conditions(dataframe, "03_conditions.png", True)
+    # cube is counted once and reused by all plots (and by next runs)
+    if MonthlyCube.is_current("accidents_cube", ["accidents.pkl.gz"]):
+        cube = MonthlyCube.load("accidents_cube")
+    else:
+        dataframe = get_dataframe("accidents.pkl.gz", verbose=True)
+        cube = MonthlyCube.build(dataframe)
+        cube.save("accidents_cube", ["accidents.pkl.gz"])
+
+    # plot_roadtype(cube, fig_location="01_roadtype.png", show_figure=True)
+    # plot_animals(cube, "02_animals.png", True)
+    plot_conditions(cube, "03_conditions.png", True)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3.9
+# coding=utf-8
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+LOADERS = ["get_dataframe", "load_dataframe"]
+
+
+def run_loader(loader: str, source: str) -> dict:
+    # imports are part of measured process, but not of measured time
+    import analysis
+
+    start = time.perf_counter()
+    df = getattr(analysis, loader)(source)
+    duration = time.perf_counter() - start
+
+    # peak resident memory of this process (kB on Linux)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {"loader": loader, "time": duration, "peak_rss": peak, "rows": len(df)}
+
+
+def bench_loaders(pickle_path: str, store_path: str):
+    sources = {"get_dataframe": pickle_path, "load_dataframe": store_path}
+
+    print("{:<16}{:>10}{:>12}{:>16}".format("loader", "rows", "time [s]", "peak RSS [MB]"))
+
+    # every loader runs in own process, so peak memory is not shared
+    for loader in LOADERS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", loader, sources[loader]],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+
+        print("{:<16}{:>10}{:>12.3f}{:>16.1f}".format(loader, result["rows"], result["time"],
+                                                      result["peak_rss"] / 1024))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument("--pickle", default="accidents.pkl.gz", help="Pickled DataFrame for get_dataframe")
+    arg_parser.add_argument("--store", default="accidents", help="Folder with column files for load_dataframe")
+    arg_parser.add_argument("--child", nargs=2, metavar=("LOADER", "SOURCE"), help=argparse.SUPPRESS)
+
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_loader(*args.child)))
+    else:
+        bench_loaders(args.pickle, args.store)
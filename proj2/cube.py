@@ -0,0 +1,73 @@
+#!/usr/bin/env python3.9
+# coding=utf-8
+import pandas as pd
+import numpy as np
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj1'))
+from columnar import save_columns, load_columns  # noqa: E402
+from derived import derived_columns  # noqa: E402
+import instrument  # noqa: E402
+
+# columns used by plot_roadtype, plot_animals and plot_conditions
+CUBE_COLUMNS = ['p21', 'p10', 'p58', 'p18']
+
+
+def source_state(sources: list) -> dict:
+    # size and time of modification of every file, folders (columns of region caches) are walked through
+    state = dict()
+
+    for source in sources:
+        paths = [source] if not os.path.isdir(source) else \
+            sorted(os.path.join(root, name) for root, _, names in os.walk(source) for name in names)
+
+        for path in paths:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                state[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    return state
+
+
+class MonthlyCube:
+    def __init__(self, frame: pd.DataFrame):
+        # columns region, date (first day of month), p21, p10, p58, p18 and count of accidents
+        self.frame = frame
+
+    @classmethod
+    def build(cls, df: pd.DataFrame) -> "MonthlyCube":
+        with instrument.stage('cube_build', rows=len(df)):
+            keys = {'region': np.asarray(df['region']),
+                    'date': derived_columns(df)['year_month']}
+            for col in CUBE_COLUMNS:
+                keys[col] = np.asarray(df[col])
+
+            # all accidents are counted in one pass
+            frame = pd.DataFrame(keys).groupby(list(keys), sort=True).size()
+
+        return cls(frame.reset_index(name='count'))
+
+    def save(self, path: str, sources: list = None):
+        save_columns(path, {col: self.frame[col].to_numpy() for col in self.frame.columns})
+
+        # state of files, from which was cube counted
+        with open(path + '.manifest.json', 'w') as f:
+            json.dump(source_state(sources or []), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "MonthlyCube":
+        return cls(pd.DataFrame(load_columns(path)))
+
+    @staticmethod
+    def is_current(path: str, sources: list) -> bool:
+        # cube is reused only when none of its sources changed since it was saved
+        if not os.path.isdir(path) or not os.path.exists(path + '.manifest.json'):
+            return False
+
+        with open(path + '.manifest.json') as f:
+            return json.load(f) == source_state(sources)
+
+    def select(self, regions: list) -> pd.DataFrame:
+        return self.frame[self.frame['region'].isin(regions)]
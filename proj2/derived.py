@@ -0,0 +1,161 @@
+#!/usr/bin/env python3.9
+# coding=utf-8
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+import weakref
+
+# memory for derived columns of one dataset
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# labels of codes used in plots, codes without label are kept
+LABELS = {'p10': {1: 'řidičem', 2: 'řidičem', 3: 'jiné',
+                  4: 'zvěří', 5: 'jiné', 6: 'jiné',
+                  7: 'jiné', 0: 'jiné'},
+          'p18': {1: 'neztížené', 2: 'mlha', 3: 'na počátku deště',
+                  4: 'déšť', 5: 'sněžení', 6: 'náledí',
+                  7: 'vítr'},
+          'p36': {0: 'dialnica',
+                  1: 'cesta 1. triedy',
+                  2: 'cesta 2. triedy',
+                  3: 'cesta 3. triedy',
+                  4: 'uzol',
+                  5: 'komunikácia sledovaná',
+                  6: 'komunikácia miestna',
+                  7: 'komunikácia účelová',
+                  8: 'komunikácia účelová'}}
+
+
+def dates(df: pd.DataFrame) -> pd.Series:
+    # column is named 'date' after loading, 'p2a' in raw data
+    column = df['date'] if 'date' in df.columns else df['p2a']
+
+    return pd.Series(np.asarray(column).astype('datetime64[ns]'))
+
+
+def relabel(values, labels: dict) -> np.ndarray:
+    return pd.Series(np.asarray(values)).replace(labels).to_numpy()
+
+
+# name of derived column: function computing it from whole DataFrame
+DERIVATIONS = {
+    'year': lambda df: dates(df).dt.year.to_numpy(),
+    'month': lambda df: dates(df).dt.month.to_numpy(),
+    'year_month': lambda df: dates(df).to_numpy().astype('datetime64[M]').astype('datetime64[ns]'),
+    'p10_label': lambda df: relabel(df['p10'], LABELS['p10']),
+    'p18_label': lambda df: relabel(df['p18'], LABELS['p18']),
+    'p36_label': lambda df: relabel(df['p36'], LABELS['p36']),
+}
+
+# columns read by derivation, its memoized values are valid only while these columns are not replaced
+SOURCES = {
+    'year': ['date', 'p2a'],
+    'month': ['date', 'p2a'],
+    'year_month': ['date', 'p2a'],
+    'p10_label': ['p10'],
+    'p18_label': ['p18'],
+    'p36_label': ['p36'],
+}
+
+
+def register(name: str, function, sources: list = None):
+    # without sources, derivation depends on all columns
+    DERIVATIONS[name] = function
+    SOURCES[name] = sources
+
+
+def column_key(column: pd.Series) -> tuple:
+    # identity of data of column (address of numpy data or extension array object) and object,
+    # which keeps data alive, so its address can not be reused by new column
+    if isinstance(column.dtype, np.dtype):
+        values = column.to_numpy()
+        return (values.__array_interface__['data'][0], values.shape, values.dtype.str), values
+
+    return id(column.array), column.array
+
+
+class DerivedColumns:
+    def __init__(self, df: pd.DataFrame, max_bytes: int = DEFAULT_MAX_BYTES):
+        # dataset is not kept alive by its derived columns
+        self.frame = weakref.ref(df)
+        self.max_bytes = max_bytes
+
+        self.columns = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def _sources(self, name: str) -> tuple:
+        df = self.frame()
+        sources = SOURCES.get(name)
+        if sources is None:
+            sources = df.columns
+
+        key = []
+        pinned = []
+        for col in sources:
+            if col in df.columns:
+                identity, values = column_key(df[col])
+                key.append((col, identity))
+                pinned.append(values)
+
+        return tuple(key), pinned
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        key, pinned = self._sources(name)
+
+        # replaced source column (e.g. df['date'] = ...) makes memoized values invalid,
+        # values changed in place are not detected
+        if name in self.columns and self.columns[name][1] == key:
+            self.hits += 1
+            self.columns.move_to_end(name)
+            return self.columns[name][0]
+
+        self.misses += 1
+        self._drop(name)
+        values = DERIVATIONS[name](self.frame())
+
+        self.columns[name] = (values, key, pinned)
+        self.nbytes += values.nbytes
+
+        # least recently used columns are dropped, the new one is always kept
+        while self.nbytes > self.max_bytes and len(self.columns) > 1:
+            _, (evicted, _, _) = self.columns.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+        return values
+
+    def _drop(self, name: str):
+        if name in self.columns:
+            self.nbytes -= self.columns.pop(name)[0].nbytes
+
+    def clear(self):
+        self.columns.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {'columns': list(self.columns), 'nbytes': self.nbytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+# derived columns of every living DataFrame (by its id)
+_REGISTRY = dict()
+
+
+def derived_columns(df: pd.DataFrame, max_bytes: int = None) -> DerivedColumns:
+    derived = _REGISTRY.get(id(df))
+
+    # id can be reused by new DataFrame after old one is deleted
+    if derived is None or derived.frame() is not df:
+        derived = DerivedColumns(df, DEFAULT_MAX_BYTES if max_bytes is None else max_bytes)
+        _REGISTRY[id(df)] = derived
+        weakref.finalize(df, _REGISTRY.pop, id(df), None)
+    elif max_bytes is not None:
+        derived.max_bytes = max_bytes
+
+    return derived
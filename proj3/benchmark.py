@@ -0,0 +1,193 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from geo import cluster_points
+from spatial import GridIndex, coordinates
+from doc import CAUSE_NAMES, preprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj1'))
+from download import DataDownloader  # noqa: E402
+
+# bounding box of Czech republic in EPSG:5514 (d, e)
+CZ_BOUNDS = ((-905000, -430000), (-1230000, -935000))
+
+
+def synthetic_points(count: int, centers: int = 40, seed: int = 0) -> np.ndarray:
+    # accidents are dense around towns, so points are normal blobs around random centers
+    rng = np.random.default_rng(seed)
+    (d_min, d_max), (e_min, e_max) = CZ_BOUNDS
+
+    towns = np.column_stack([rng.uniform(d_min, d_max, centers), rng.uniform(e_min, e_max, centers)])
+    town = rng.integers(0, centers, count)
+
+    return towns[town] + rng.normal(0, 8000, (count, 2))
+
+
+def synthetic_accidents(count: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    # codes of causes from all buckets and some codes without bucket
+    causes = np.concatenate([[100], np.arange(201, 210), np.arange(301, 312), np.arange(401, 415),
+                             np.arange(501, 517), np.arange(601, 616), [0, 517, 600]])
+
+    return pd.DataFrame({'p1': np.arange(count),
+                         'p12': rng.choice(causes, count),
+                         'p13a': rng.choice([0, 0, 0, 0, 0, 0, 0, 1, 2, -1], count),
+                         'p36': rng.integers(0, 9, count),
+                         'region': rng.choice(['PHA', 'STC', 'JHC', 'PLK', 'KVK', 'ULK', 'LBK',
+                                               'HKK', 'PAK', 'OLK', 'MSK', 'JHM', 'ZLK', 'VYS'], count)})
+
+
+def legacy_preprocessing(df: pd.DataFrame):
+    # original implementation of doc.preprocessing for comparison
+    df = df[['p1', 'p12', 'p13a', 'p36', 'region']]
+
+    mortality_reg = df.groupby(['region']).agg({'p13a': 'sum'}).reset_index()
+
+    df = df.loc[df['p13a'] > 0].copy()
+    df.loc[df['p12'] > 600, 'p12'] = 6
+    df.loc[(df['p12'] > 500) & (df['p12'] < 517), 'p12'] = 5
+    df.loc[(df['p12'] > 400) & (df['p12'] < 415), 'p12'] = 4
+    df.loc[(df['p12'] > 300) & (df['p12'] < 312), 'p12'] = 3
+    df.loc[(df['p12'] > 200) & (df['p12'] < 210), 'p12'] = 2
+    df.loc[(df['p12'] == 100), 'p12'] = 1
+
+    data_type_of_traffic = df.groupby(['p12', 'p36']).agg({'p13a': 'sum'}).reset_index()
+
+    df = df.groupby(['p12']).agg({'p13a': 'sum'}).reset_index()
+    cause_of_the_accident = df.set_index('p12').rename(CAUSE_NAMES).reset_index()
+
+    return [mortality_reg, cause_of_the_accident, data_type_of_traffic]
+
+
+def load_points(filename: str) -> np.ndarray:
+    df = pd.read_pickle(filename)
+    points = np.column_stack([coordinates(df['d']), coordinates(df['e'])])
+
+    return points[np.isfinite(points).all(axis=1)]
+
+
+def bench_cluster(points: np.ndarray, sizes: list, n_clusters: int, sample_size: int, repeat: int):
+    rng = np.random.default_rng(1)
+
+    print("{:>10}{:>10}{:>12}".format("points", "mode", "time [s]"))
+
+    for size in sizes:
+        subset = points[rng.choice(len(points), size, replace=size > len(points))]
+
+        for mode, sample in [("full", None), ("sample", sample_size)]:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cluster_points(subset, n_clusters, sample)
+                duration = time.perf_counter() - start
+
+                best = duration if best is None else min(best, duration)
+
+            print("{:>10}{:>10}{:>12.3f}".format(size, mode, best))
+
+
+def bench_index(points: np.ndarray, queries: int, radius: float, k: int):
+    rng = np.random.default_rng(2)
+    d, e = points[:, 0], points[:, 1]
+
+    start = time.perf_counter()
+    index = GridIndex(d, e)
+    print("{:<12}{:>12.3f}".format("build", time.perf_counter() - start))
+
+    centers = points[rng.choice(len(points), queries)]
+    print("{:<12}{:>12}{:>12}".format("query", "mask [s]", "index [s]"))
+
+    def mask_radius(c):
+        return np.flatnonzero(np.hypot(d - c[0], e - c[1]) <= radius)
+
+    def mask_bbox(c):
+        return np.flatnonzero((d >= c[0] - radius) & (d <= c[0] + radius) &
+                              (e >= c[1] - radius) & (e <= c[1] + radius))
+
+    def mask_nearest(c):
+        return np.argsort(np.hypot(d - c[0], e - c[1]), kind='stable')[:k]
+
+    tests = [("bbox", mask_bbox, lambda c: index.bbox(c[0] - radius, c[0] + radius, c[1] - radius, c[1] + radius)),
+             ("radius", mask_radius, lambda c: index.radius(c[0], c[1], radius)),
+             ("nearest", mask_nearest, lambda c: index.nearest(c[0], c[1], k))]
+
+    for name, mask_query, index_query in tests:
+        start = time.perf_counter()
+        expected = [mask_query(c) for c in centers]
+        mask_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [index_query(c) for c in centers]
+        index_time = time.perf_counter() - start
+
+        # nearest points with same distance may be in different order
+        same = all(np.array_equal(np.sort(a), np.sort(b)) for a, b in zip(expected, found))
+        print("{:<12}{:>12.3f}{:>12.3f}{}".format(name, mask_time, index_time, "" if same else "  DIFFERENT"))
+
+
+def downloaded_accidents(folder: str) -> pd.DataFrame:
+    # types of columns are the same as in real use (int32 codes)
+    data = DataDownloader(folder=folder).get_dict(columns=['p1', 'p12', 'p13a', 'p36', 'region'])
+
+    return pd.DataFrame({col: np.asarray(values) for col, values in data.items()})
+
+
+def bench_preprocessing(sizes: list, repeat: int, folder: str = None):
+    print("{:>10}{:>12}{:>12}{:>8}".format("rows", "legacy [s]", "fused [s]", "same"))
+
+    frames = [downloaded_accidents(folder)] if folder else [synthetic_accidents(size) for size in sizes]
+
+    for df in frames:
+        size = len(df)
+
+        times = dict()
+        results = dict()
+        for name, function in [("legacy", legacy_preprocessing), ("fused", preprocessing)]:
+            times[name] = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results[name] = function(df)
+                duration = time.perf_counter() - start
+
+                times[name] = duration if times[name] is None else min(times[name], duration)
+
+        same = all(a.equals(b) for a, b in zip(results["legacy"], results["fused"]))
+        print("{:>10}{:>12.3f}{:>12.3f}{:>8}".format(size, times["legacy"], times["fused"], str(same)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument("stage", choices=["cluster", "index", "preprocessing"])
+    arg_parser.add_argument("--data", help="Pickled DataFrame with columns d and e (synthetic points if missing)")
+    arg_parser.add_argument("--folder", help="Folder with ZIP files for preprocessing (synthetic data if missing)")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    arg_parser.add_argument("--clusters", type=int, default=15)
+    arg_parser.add_argument("--sample", type=int, default=50000, help="Sample size for sample-then-assign mode")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--queries", type=int, default=200, help="Count of queries for index")
+    arg_parser.add_argument("--radius", type=float, default=2000.0, help="Radius of query for index [m]")
+    arg_parser.add_argument("--k", type=int, default=10, help="Count of nearest accidents for index")
+
+    args = arg_parser.parse_args()
+
+    if args.stage == "preprocessing":
+        bench_preprocessing(args.sizes, args.repeat, args.folder)
+    else:
+        if args.data:
+            points = load_points(args.data)
+        else:
+            points = synthetic_points(max(args.sizes))
+
+        if args.stage == "cluster":
+            bench_cluster(points, args.sizes, args.clusters, args.sample, args.repeat)
+        else:
+            bench_index(points[:max(args.sizes)], args.queries, args.radius, args.k)
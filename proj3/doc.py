@@ -2,46 +2,163 @@ import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
 import seaborn as sns
+import os
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj1'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj2'))
+from derived import derived_columns, register, LABELS  # noqa: E402
+import instrument  # noqa: E402
 
-def preprocessing(df: pd.DataFrame):
-    df = df[['p1', 'p12', 'p13a', 'p36', 'region']]
+CAUSE_NAMES = {1: 'Nezavinené vodičom',
+               2: 'Neprimeraná rýchlosť jazdy',
+               3: 'Nesprávne predbiehanie',
+               4: 'Nedanie prednosti v jazde',
+               5: 'Nesprávny zpôsob jazdy',
+               6: 'technická závada vozidla'}
+
+
+def cause_table() -> np.ndarray:
+    # bucket of every code of p12, codes above 600 share last item
+    table = np.arange(602)
+    table[601:] = 6
+    table[501:517] = 5
+    table[401:415] = 4
+    table[301:312] = 3
+    table[201:210] = 2
+    table[100] = 1
+
+    return table
+
+
+CAUSE_TABLE = cause_table()
+
+
+def bucket_codes(p12: np.ndarray) -> np.ndarray:
+    p12 = np.asarray(p12)
+    buckets = p12.copy()
+
+    # missing (negative) codes are kept
+    known = p12 >= 0
+    buckets[known] = CAUSE_TABLE[np.minimum(p12[known], len(CAUSE_TABLE) - 1).astype(np.int64)]
+
+    return buckets
+
+
+register('p12_cause', lambda df: bucket_codes(df['p12']), ['p12'])
+
+
+def bucket_causes(df: pd.DataFrame) -> pd.DataFrame:
+    df['p12'] = bucket_codes(df['p12'].to_numpy())
+
+    return df
+
+
+def group_codes(values) -> tuple:
+    # small integer codes are counted directly, other values are hashed
+    if values.dtype.kind in 'iu' and len(values):
+        values = np.asarray(values)
+        minimum, maximum = values.min(), values.max()
+
+        if maximum - minimum < 1 << 16:
+            shifted = values - minimum
+            labels = np.flatnonzero(np.bincount(shifted))
+            lookup = np.zeros(maximum - minimum + 1, dtype=np.int64)
+            lookup[labels] = np.arange(len(labels))
+
+            # labels keep type of input, e.g. int32 from DataDownloader
+            return lookup[shifted], (labels + minimum).astype(values.dtype)
+
+    return pd.factorize(values, sort=True, use_na_sentinel=False)
+
+
+def cause_sums(df: pd.DataFrame) -> pd.DataFrame:
+    p13a = np.asarray(df['p13a'])
+
+    # buckets of DataFrame are kept for next calls, chunks are bucketed every time
+    if isinstance(df, pd.DataFrame):
+        causes = derived_columns(df)['p12_cause']
+        region, p36 = df['region'], df['p36']
+    else:
+        causes = bucket_codes(df['p12'])
+        # chunks of compact DataDownloader have encoded text columns
+        region, p36 = np.asarray(df['region']), np.asarray(df['p36'])
+
+    # every row gets one number for its combination of region, cause and type of road
+    keys = [group_codes(values) for values in [region, causes, p36]]
+    shape = tuple(len(labels) for _, labels in keys)
+    group = np.ravel_multi_index(tuple(codes for codes, _ in keys), shape)
+
+    # all three tables are made from sums of this one pass
+    size = int(np.prod(shape))
+    present = np.flatnonzero(np.bincount(group, minlength=size))
+    sums = {'p13a': p13a,
+            # deaths and count of accidents with at least one death
+            'deaths': np.where(p13a > 0, p13a, 0),
+            'fatal': (p13a > 0).astype(np.int64)}
+    sums = {name: np.bincount(group, weights=values, minlength=size)[present].astype(values.dtype)
+            for name, values in sums.items()}
 
+    index = pd.MultiIndex.from_arrays([labels[codes] for (_, labels), codes
+                                       in zip(keys, np.unravel_index(present, shape))],
+                                      names=['region', 'p12', 'p36'])
+
+    return pd.DataFrame(sums, index=index)
+
+
+def split_sums(sums: pd.DataFrame) -> list:
     # necessary data for mortality in regions
-    mortality_reg = df.groupby(['region']).agg({'p13a': 'sum'}).reset_index()
+    mortality_reg = sums.groupby(level='region')[['p13a']].sum().reset_index()
 
-    # necessary data for the most common cause of accidents
-    df = df.loc[df['p13a'] > 0]
-    
-    df.loc[df['p12'] > 600, 'p12'] = 6
-    df.loc[(df['p12'] > 500) & (df['p12'] < 517), 'p12'] = 5
-    df.loc[(df['p12'] > 400) & (df['p12'] < 415), 'p12'] = 4
-    df.loc[(df['p12'] > 300) & (df['p12'] < 312), 'p12'] = 3
-    df.loc[(df['p12'] > 200) & (df['p12'] < 210), 'p12'] = 2
-    df.loc[(df['p12'] == 100), 'p12'] = 1
+    # necessary data for the most common cause of accidents (only accidents with death)
+    sums = sums[sums['fatal'] > 0].reset_index()
 
-    data_type_of_traffic = df.groupby(['p12', 'p36']).agg({'p13a': 'sum'})
-    data_type_of_traffic = data_type_of_traffic.reset_index()
+    data_type_of_traffic = sums.dropna(subset=['p12', 'p36']).groupby(['p12', 'p36'])[['deaths']].sum()
+    data_type_of_traffic = data_type_of_traffic.rename(columns={'deaths': 'p13a'}).reset_index()
 
-    df = df.groupby(['p12']).agg({'p13a': 'sum'}).reset_index()
-    
-    df = df.set_index('p12')
-    df = df.rename({1: 'Nezavinené vodičom',
-                    2: 'Neprimeraná rýchlosť jazdy',
-                    3: 'Nesprávne predbiehanie',
-                    4: 'Nedanie prednosti v jazde',
-                    5: 'Nesprávny zpôsob jazdy',
-                    6: 'technická závada vozidla'}).reset_index()
-
-    cause_of_the_accident = df
-    
-    data = [mortality_reg, 
+    df = sums.dropna(subset=['p12']).groupby(['p12'])[['deaths']].sum()
+    cause_of_the_accident = df.rename(columns={'deaths': 'p13a'}).rename(CAUSE_NAMES).reset_index()
+
+    return [mortality_reg,
             cause_of_the_accident,
             data_type_of_traffic]
-    
-    return data
 
 
+def preprocessing(df: pd.DataFrame):
+    with instrument.stage('preprocessing', rows=len(df)):
+        return split_sums(cause_sums(df))
+
+
+@instrument.instrumented('preprocessing_stream')
+def preprocessing_stream(chunks):
+    sums = None
+
+    # chunks are dictionaries of arrays or DataFrames, only sums are kept between them
+    for chunk in chunks:
+        sums = add_sums(sums, cause_sums(chunk))
+
+    # no chunks give the same tables as no rows
+    if sums is None:
+        sums = empty_sums()
+
+    return split_sums(sums)
+
+
+def empty_sums() -> pd.DataFrame:
+    index = pd.MultiIndex.from_arrays([[], [], []], names=['region', 'p12', 'p36'])
+
+    return pd.DataFrame({name: np.array([], dtype=np.int64) for name in ['p13a', 'deaths', 'fatal']},
+                        index=index)
+
+
+def add_sums(total: pd.DataFrame, part: pd.DataFrame) -> pd.DataFrame:
+    if total is None:
+        return part
+
+    return pd.concat([total, part]).groupby(level=list(range(part.index.nlevels)), dropna=False).sum()
+
+
+@instrument.instrumented('plot_cause_of_accident')
 def plot_cause_of_accident(df: pd.DataFrame, fig_location, show_figure: bool = False):
     fig, ax = plt.subplots(figsize=(10, 8.27))
     g = sns.barplot(ax=ax,
@@ -63,6 +180,7 @@ def plot_cause_of_accident(df: pd.DataFrame, fig_location, show_figure: bool = F
         plt.show()
 
 
+@instrument.instrumented('plot_region_mortality')
 def plot_region_mortality(df: pd.DataFrame, fig_location, show_figure: bool = False):
     fig, ax = plt.subplots(figsize=(8.40, 8.27))
     g = sns.barplot(ax=ax,
@@ -86,23 +204,10 @@ def plot_region_mortality(df: pd.DataFrame, fig_location, show_figure: bool = Fa
 
 def make_table(df: pd.DataFrame):
     df = df.set_index('p12')
-    df = df.rename({1: 'Nezavinené vodičom',
-                    2: 'Neprimeraná rýchlosť jazdy',
-                    3: 'Nesprávne predbiehanie',
-                    4: 'Nedanie prednosti v jazde',
-                    5: 'Nesprávny zpôsob jazdy',
-                    6: 'technická závada vozidla'}).reset_index()
+    df = df.rename(CAUSE_NAMES).reset_index()
     
     df = df.set_index('p36')
-    df = df.rename({0: 'dialnica',
-                    1: 'cesta 1. triedy',
-                    2: 'cesta 2. triedy',
-                    3: 'cesta 3. triedy',
-                    4: 'uzol',
-                    5: 'komunikácia sledovaná',
-                    6: 'komunikácia miestna',
-                    7: 'komunikácia účelová',
-                    8: 'komunikácia účelová'}).reset_index()
+    df = df.rename(LABELS['p36']).reset_index()
     
     df = pd.pivot_table(df, columns='p12', values='p13a', index='p36', fill_value=0)
     df = df.astype(int)
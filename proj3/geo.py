@@ -7,6 +7,15 @@ import contextily as ctx
 import sklearn.cluster
 import numpy as np
 import os
+import sys
+
+from spatial import GridIndex, coordinates
+from tiles import TileCache, add_basemap
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj1'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proj2'))
+from derived import derived_columns  # noqa: E402
+import instrument  # noqa: E402
 
 def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     return geopandas.GeoDataFrame(df,
@@ -14,20 +23,67 @@ def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
                                   crs='EPSG:5514')
 
 
+def make_index(df: pd.DataFrame, cell_size: float = 1000.0) -> GridIndex:
+    # index over raw coordinates, shapely points are made only for results
+    return GridIndex(df['d'], df['e'], cell_size)
+
+
+def select_geo(df: pd.DataFrame, rows: np.ndarray) -> geopandas.GeoDataFrame:
+    return make_geo(df.iloc[rows])
+
+
 def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
-             show_figure: bool = False):
+             show_figure: bool = False, projection_cache: str = None,
+             tiles: TileCache = None):
+    draw_geo(geo_table(gdf, projection_cache), fig_location, show_figure, tiles)
+
+
+@instrument.instrumented('geo_table')
+def geo_table(gdf: geopandas.GeoDataFrame,
+              projection_cache: str = None) -> geopandas.GeoDataFrame:
+    # years of whole dataset are computed once and reused by next calls
+    years = derived_columns(gdf)['year']
+
+    mask = (gdf['region'] == 'JHM').to_numpy()
+    gdf = gdf.loc[mask, ['p1', 'p36', 'p2a', 'region', 'geometry']]
+    gdf = gdf.assign(p2a=years[mask])
+
+    if projection_cache is None:
+        return gdf.to_crs("epsg:3857")
+
+    # projected coordinates are reused while accidents are the same
+    p1 = gdf['p1'].to_numpy()
+    if p1.dtype == object:
+        p1 = p1.astype('U')
 
-    gdf = gdf[['p1', 'p36', 'p2a', 'region', 'geometry']]
-    gdf = gdf[gdf['region'] == 'JHM']
-    gdf['p2a'] = pd.DatetimeIndex(gdf['p2a']).year
+    if os.path.isfile(projection_cache):
+        with np.load(projection_cache, allow_pickle=False) as cached:
+            if np.array_equal(cached['p1'], p1):
+                return geopandas.GeoDataFrame(gdf.drop(columns='geometry'),
+                                              geometry=geopandas.points_from_xy(cached['x'], cached['y']),
+                                              crs='EPSG:3857')
 
     gdf = gdf.to_crs("epsg:3857")
+    np.savez(projection_cache, p1=p1, x=gdf.geometry.x.to_numpy(), y=gdf.geometry.y.to_numpy())
+
+    return gdf
+
+
+@instrument.instrumented('draw_geo')
+def draw_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
+             show_figure: bool = False, tiles: TileCache = None):
 
     fig, axes = plt.subplots(3,2, figsize=(12, 7))
 
     color = ['green', 'red']
     titles = ['JHM kraj: dalnice', 'JHM kraj: silnice prvni tridy']
 
+    # all subplots show same area, so basemap is made only once
+    x_min, y_min, x_max, y_max = gdf.total_bounds
+    if tiles is None:
+        tiles = TileCache()
+    basemap, extent = tiles.image(x_min, x_max, y_min, y_max)
+
     year = 2018
     for i in range(0, 3):
         gdf_tmp = gdf[gdf['p2a'] == (year + i)] 
@@ -35,11 +91,11 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
             gdf_tmp[gdf_tmp['p36'] == j].plot(ax=axes[i][j],
                                               markersize=0.8,
                                               color=color[j])
-            ctx.add_basemap(axes[i][j], 
-                            crs=gdf_tmp.crs.to_string(), 
-                            source=ctx.providers.Stamen.TonerLite, 
-                            alpha=0.9,
-                            attribution_size=5)
+            axes[i][j].set_xlim(x_min, x_max)
+            axes[i][j].set_ylim(y_min, y_max)
+            add_basemap(axes[i][j], basemap, extent,
+                        alpha=0.9,
+                        attribution_size=5)
             
             title = titles[j] + ' (' + str(year + i) + ')'
             axes[i][j].set_title(title)
@@ -59,12 +115,83 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
         plt.show()
 
     
+def cluster_points(points: np.ndarray, n_clusters: int = 15,
+                   sample_size: int = None, random_state: int = 0):
+    # mini batches keep memory and time linear in count of points
+    model = sklearn.cluster.MiniBatchKMeans(n_clusters=n_clusters,
+                                            batch_size=4096,
+                                            n_init=3,
+                                            random_state=random_state)
+
+    # centers are found on random sample, all points are only assigned to them
+    if sample_size is not None and sample_size < len(points):
+        rng = np.random.default_rng(random_state)
+        model.fit(points[rng.choice(len(points), sample_size, replace=False)])
+        labels = model.predict(points)
+    else:
+        labels = model.fit_predict(points)
+
+    return labels, model.cluster_centers_
+
+
+def cluster_stats(points: np.ndarray, labels: np.ndarray,
+                  n_clusters: int) -> pd.DataFrame:
+    count = np.bincount(labels, minlength=n_clusters)
+
+    # centroid of assigned points (EPSG:5514)
+    with np.errstate(invalid='ignore'):
+        d = np.bincount(labels, weights=points[:, 0], minlength=n_clusters) / count
+        e = np.bincount(labels, weights=points[:, 1], minlength=n_clusters) / count
+
+    stats = pd.DataFrame({'cluster': np.arange(n_clusters), 'count': count, 'd': d, 'e': e})
+
+    return stats.sort_values('count', ascending=False).reset_index(drop=True)
+
+
+@instrument.instrumented('plot_cluster')
 def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
-                 show_figure: bool = False):
-    pass
+                 show_figure: bool = False, n_clusters: int = 15,
+                 sample_size: int = None) -> pd.DataFrame:
+
+    # clustering works on raw coordinates, no geometry objects are needed
+    points = np.column_stack([coordinates(gdf['d']), coordinates(gdf['e'])])
+    points = points[np.isfinite(points).all(axis=1)]
+
+    labels, _ = cluster_points(points, n_clusters, sample_size)
+    stats = cluster_stats(points, labels, n_clusters)
+
+    fig, ax = plt.subplots(figsize=(12, 7))
+
+    ax.scatter(points[:, 0], points[:, 1], c=labels, s=0.5,
+               cmap='tab20', alpha=0.5, rasterized=True)
+    ax.scatter(stats['d'], stats['e'], s=stats['count'] / stats['count'].max() * 500,
+               facecolors='none', edgecolors='black')
+
+    ctx.add_basemap(ax,
+                    crs='EPSG:5514',
+                    source=ctx.providers.CartoDB.Positron,
+                    alpha=0.9,
+                    attribution_size=5)
+
+    ax.set_title('Shluky nehod')
+    ax.axis('off')
+
+    if fig_location is not None:
+        dir_name = os.path.dirname(fig_location)
+
+        if dir_name:
+            if not os.path.isdir(dir_name):
+                os.makedirs(dir_name)
+
+        plt.savefig(fig_location)
+
+    if show_figure:
+        plt.show()
+
+    return stats
 
 
 if __name__ == "__main__":
     gdf = make_geo(pd.read_pickle("accidents.pkl.gz"))
-    plot_geo(gdf, "geo1.png", True)
-    plot_cluster(gdf, "geo2.png", True)
+    plot_geo(gdf, "geo1.png", True, projection_cache="geo_3857.npz")
+    print(plot_cluster(gdf, "geo2.png", True, sample_size=100000))
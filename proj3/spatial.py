@@ -0,0 +1,91 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+import numpy as np
+
+# DataDownloader stores empty coordinate as -1
+MISSING = -1
+
+
+def coordinates(values) -> np.ndarray:
+    # missing coordinates (NaN or -1) are NaN
+    values = np.array(values, dtype=float)
+    values[values == MISSING] = np.nan
+
+    return values
+
+
+class GridIndex:
+    def __init__(self, d, e, cell_size: float = 1000.0):
+        # coordinates in EPSG:5514 (meters), rows without position are not indexed
+        self.d = coordinates(d)
+        self.e = coordinates(e)
+        self.cell_size = cell_size
+
+        rows = np.flatnonzero(np.isfinite(self.d) & np.isfinite(self.e))
+
+        if len(rows):
+            self.d_min, self.e_min = self.d[rows].min(), self.e[rows].min()
+            self.nd = int((self.d[rows].max() - self.d_min) // cell_size) + 1
+            self.ne = int((self.e[rows].max() - self.e_min) // cell_size) + 1
+        else:
+            self.d_min, self.e_min = 0.0, 0.0
+            self.nd, self.ne = 1, 1
+
+        cells = self._cells(self.d[rows], self.e[rows])
+
+        # rows sorted by cell, cell i holds rows[offsets[i]:offsets[i + 1]]
+        order = np.argsort(cells, kind='stable')
+        self.rows = rows[order]
+        self.offsets = np.zeros(self.nd * self.ne + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.nd * self.ne), out=self.offsets[1:])
+
+    def _cells(self, d, e):
+        return self._cell_e(e) * self.nd + self._cell_d(d)
+
+    def _cell_d(self, d):
+        return np.clip((np.asarray(d) - self.d_min) // self.cell_size, 0, self.nd - 1).astype(np.int64)
+
+    def _cell_e(self, e):
+        return np.clip((np.asarray(e) - self.e_min) // self.cell_size, 0, self.ne - 1).astype(np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def bbox(self, d_min: float, d_max: float, e_min: float, e_max: float) -> np.ndarray:
+        # cells of one grid row are next to each other, so every grid row is one slice
+        d_first, d_last = self._cell_d(d_min), self._cell_d(d_max)
+
+        candidates = [self.rows[self.offsets[ie * self.nd + d_first]:self.offsets[ie * self.nd + d_last + 1]]
+                      for ie in range(self._cell_e(e_min), self._cell_e(e_max) + 1)]
+        candidates = np.concatenate(candidates)
+
+        d, e = self.d[candidates], self.e[candidates]
+        inside = (d >= d_min) & (d <= d_max) & (e >= e_min) & (e <= e_max)
+
+        return np.sort(candidates[inside])
+
+    def radius(self, d: float, e: float, r: float) -> np.ndarray:
+        candidates = self.bbox(d - r, d + r, e - r, e + r)
+
+        return candidates[self._distance(candidates, d, e) <= r]
+
+    def nearest(self, d: float, e: float, k: int = 1) -> np.ndarray:
+        k = min(k, len(self))
+        r = self.cell_size
+        max_r = np.hypot(self.nd, self.ne) * self.cell_size + np.hypot(d - self.d_min, e - self.e_min)
+
+        # search box grows until k-th nearest point is surely inside it
+        while True:
+            candidates = self.bbox(d - r, d + r, e - r, e + r)
+
+            if len(candidates) >= k:
+                distance = self._distance(candidates, d, e)
+                order = np.argsort(distance, kind='stable')[:k]
+
+                if k == 0 or distance[order[-1]] <= r or r >= max_r:
+                    return candidates[order]
+
+            r *= 2
+
+    def _distance(self, rows, d, e):
+        return np.hypot(self.d[rows] - d, self.e[rows] - e)
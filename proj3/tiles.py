@@ -0,0 +1,129 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+import numpy as np
+import matplotlib.pyplot as plt
+import requests
+import io
+import os
+
+# Stamen tiles are no longer served, CartoDB light tiles look similar to TonerLite
+TILE_URL = "https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png"
+ATTRIBUTION = "(C) OpenStreetMap contributors (C) CARTO"
+
+# half of width of the world in EPSG:3857
+WORLD = 20037508.342789244
+TILE_SIZE = 256
+
+
+class TileCache:
+    def __init__(self, folder: str = "tiles", url: str = TILE_URL,
+                 max_bytes: int = 200 * 1024 * 1024, offline: bool = False):
+        self.folder = folder
+        self.url = url
+        self.max_bytes = max_bytes
+        # without network, only tiles on disk are used
+        self.offline = offline
+
+    def tile_path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.folder, str(z), str(x), "{}.png".format(y))
+
+    def tile(self, z: int, x: int, y: int) -> np.ndarray:
+        path = self.tile_path(z, x, y)
+
+        if os.path.isfile(path):
+            # time of last use is kept in mtime, it orders tiles for eviction
+            os.utime(path)
+        elif self.offline:
+            raise FileNotFoundError("tile {}/{}/{} is not in cache {}".format(z, x, y, self.folder))
+        else:
+            response = requests.get(self.url.format(z=z, x=x, y=y), timeout=30,
+                                    headers={"User-Agent": "izv-tile-cache"})
+            response.raise_for_status()
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".part", "wb") as f:
+                f.write(response.content)
+            os.replace(path + ".part", path)
+
+        with open(path, "rb") as f:
+            image = plt.imread(io.BytesIO(f.read()), format="png")
+
+        # tiles without alpha channel are made opaque
+        if image.shape[2] == 3:
+            image = np.dstack([image, np.ones(image.shape[:2], dtype=image.dtype)])
+
+        return image
+
+    def image(self, x_min: float, x_max: float, y_min: float, y_max: float, zoom: int = None):
+        # bounds are in EPSG:3857, result is image and its extent for imshow
+        if zoom is None:
+            zoom = auto_zoom(x_max - x_min)
+
+        x_first, y_first = tile_index(x_min, y_max, zoom)
+        x_last, y_last = tile_index(x_max, y_min, zoom)
+
+        image = np.zeros(((y_last - y_first + 1) * TILE_SIZE, (x_last - x_first + 1) * TILE_SIZE, 4))
+        for x in range(x_first, x_last + 1):
+            for y in range(y_first, y_last + 1):
+                top, left = (y - y_first) * TILE_SIZE, (x - x_first) * TILE_SIZE
+                image[top:top + TILE_SIZE, left:left + TILE_SIZE] = self.tile(zoom, x, y)
+
+        if not self.offline:
+            self.evict()
+
+        size = 2 * WORLD / 2 ** zoom
+        extent = (-WORLD + x_first * size, -WORLD + (x_last + 1) * size,
+                  WORLD - (y_last + 1) * size, WORLD - y_first * size)
+
+        return image, extent
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._files())
+
+    def evict(self):
+        files = self._files()
+        total = sum(size for _, _, size in files)
+
+        # least recently used tiles are removed first
+        for _, path, size in sorted(files):
+            if total <= self.max_bytes:
+                break
+
+            os.remove(path)
+            total -= size
+
+    def _files(self):
+        files = []
+
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith(".png"):
+                    stat = os.stat(os.path.join(root, name))
+                    files.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+
+        return files
+
+
+def tile_index(x: float, y: float, zoom: int):
+    size = 2 * WORLD / 2 ** zoom
+    last = 2 ** zoom - 1
+
+    return (min(max(int((x + WORLD) // size), 0), last),
+            min(max(int((WORLD - y) // size), 0), last))
+
+
+def auto_zoom(width: float, tiles: int = 4) -> int:
+    # about given count of tiles over width of the map
+    return int(np.clip(np.floor(np.log2(2 * WORLD * tiles / max(width, 1.0))), 0, 18))
+
+
+def add_basemap(ax, image: np.ndarray, extent: tuple, alpha: float = 0.9,
+                attribution_size: int = 5):
+    # map is drawn under points, limits of axes are kept
+    limits = ax.get_xlim(), ax.get_ylim()
+
+    ax.imshow(image, extent=extent, alpha=alpha, zorder=0, interpolation="bilinear")
+    ax.set_xlim(*limits[0])
+    ax.set_ylim(*limits[1])
+
+    ax.text(0.005, 0.005, ATTRIBUTION, transform=ax.transAxes, fontsize=attribution_size)
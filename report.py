@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import matplotlib
+
+# figures are only saved, so workers never need a window
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+
+import argparse  # noqa: E402
+import concurrent.futures  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for project in ["proj1", "proj2", "proj3"]:
+    sys.path.append(os.path.join(ROOT, project))
+
+from download import DataDownloader  # noqa: E402
+import instrument  # noqa: E402
+from get_stat import stat_tables, draw_stat  # noqa: E402
+from analysis import load_dataframe, roadtype_table, animals_table, conditions_table  # noqa: E402
+from analysis import draw_roadtype, draw_animals, draw_conditions  # noqa: E402
+from cube import MonthlyCube  # noqa: E402
+from doc import preprocessing, plot_region_mortality, plot_cause_of_accident  # noqa: E402
+
+# columns of DataDownloader.get_dict, which are needed by some of figures
+STAT_COLUMNS = ["region", "p24"]
+CUBE_COLUMNS = ["region", "p2a", "p21", "p10", "p58", "p18"]
+DOC_COLUMNS = ["p1", "p12", "p13a", "p36", "region"]
+GEO_COLUMNS = ["p1", "p36", "p2a", "region", "d", "e"]
+
+
+def stat_aggregate(data, shared):
+    return stat_tables({col: data[col] for col in STAT_COLUMNS})
+
+
+def stat_render(table, fig_location):
+    draw_stat(*table, fig_location=fig_location)
+
+
+def cube_aggregate(shared, cube_path):
+    # cube is shared by plots from analysis.py, it is built only once
+    if "cube" not in shared:
+        # cube on disk is counted from region caches, changed cache makes it stale
+        downloader = shared["downloader"]
+        sources = [downloader._cache_path(region) for region in downloader.regions]
+
+        if cube_path is not None and MonthlyCube.is_current(cube_path, sources):
+            shared["cube"] = MonthlyCube.load(cube_path)
+        else:
+            shared["cube"] = MonthlyCube.build(load_dataframe(shared["data"], columns=CUBE_COLUMNS))
+
+            if cube_path is not None:
+                shared["cube"].save(cube_path, sources)
+
+    return shared["cube"]
+
+
+def roadtype_aggregate(data, shared):
+    return roadtype_table(cube_aggregate(shared, shared["cube_path"]))
+
+
+def animals_aggregate(data, shared):
+    return animals_table(cube_aggregate(shared, shared["cube_path"]))
+
+
+def conditions_aggregate(data, shared):
+    return conditions_table(cube_aggregate(shared, shared["cube_path"]))
+
+
+def doc_aggregate(data, shared):
+    # preprocessing returns tables for both figures from doc.py
+    if "doc" not in shared:
+        shared["doc"] = preprocessing(pd.DataFrame({col: np.asarray(data[col]) for col in DOC_COLUMNS}))
+
+    return shared["doc"]
+
+
+def region_mortality_aggregate(data, shared):
+    return doc_aggregate(data, shared)[0]
+
+
+def cause_of_accident_aggregate(data, shared):
+    return doc_aggregate(data, shared)[1]
+
+
+def geo_aggregate(data, shared):
+    # geopandas is imported only when map is requested
+    from geo import make_geo, geo_table
+
+    # map shows only JHM, other regions are not read
+    data = shared["downloader"].query(regions=["JHM"], columns=GEO_COLUMNS)
+    df = pd.DataFrame({col: np.asarray(data[col]) for col in GEO_COLUMNS})
+    return geo_table(make_geo(df))
+
+
+def geo_render(table, fig_location):
+    from geo import draw_geo
+
+    draw_geo(table, fig_location)
+
+
+# name of figure: (columns of shared load of all regions, aggregation in main process, rendering in worker, file name)
+FIGURES = {
+    "stat": (STAT_COLUMNS, stat_aggregate, stat_render, "stat.png"),
+    "roadtype": (CUBE_COLUMNS, roadtype_aggregate, draw_roadtype, "01_roadtype.png"),
+    "animals": (CUBE_COLUMNS, animals_aggregate, draw_animals, "02_animals.png"),
+    "conditions": (CUBE_COLUMNS, conditions_aggregate, draw_conditions, "03_conditions.png"),
+    "geo": ([], geo_aggregate, geo_render, "geo1.png"),
+    "region_mortality": (DOC_COLUMNS, region_mortality_aggregate, plot_region_mortality, "fig1.png"),
+    "cause_of_accident": (DOC_COLUMNS, cause_of_accident_aggregate, plot_cause_of_accident, "fig2.png"),
+}
+
+
+def render(name, table, fig_location):
+    start = time.perf_counter()
+    with instrument.stage("render", figure=name):
+        FIGURES[name][2](table, fig_location)
+
+    # worker renders many figures, old ones are not kept in memory
+    plt.close("all")
+
+    return time.perf_counter() - start
+
+
+def run_report(names, folder="data", output="report", workers=None, cube_path=None):
+    timings = {name: dict() for name in names}
+
+    columns = sorted({col for name in names for col in FIGURES[name][0]})
+
+    start = time.perf_counter()
+    downloader = DataDownloader(folder=folder)
+    data = downloader.get_dict(columns=columns) if columns else dict()
+    load_time = time.perf_counter() - start
+
+    os.makedirs(output, exist_ok=True)
+    shared = {"data": data, "cube_path": cube_path, "downloader": downloader}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict()
+
+        # figure is rendered as soon as its aggregate is ready
+        for name in names:
+            start = time.perf_counter()
+            with instrument.stage("aggregate", figure=name):
+                table = FIGURES[name][1](data, shared)
+            timings[name]["aggregate"] = time.perf_counter() - start
+
+            futures[name] = executor.submit(render, name, table, os.path.join(output, FIGURES[name][3]))
+
+        for name, future in futures.items():
+            timings[name]["render"] = future.result()
+
+    return load_time, timings
+
+
+def print_timings(load_time, timings):
+    print("{:<20}{:>16}{:>14}".format("figure", "aggregate [s]", "render [s]"))
+
+    for name, timing in timings.items():
+        print("{:<20}{:>16.3f}{:>14.3f}".format(name, timing["aggregate"], timing["render"]))
+
+    print("{:<20}{:>16.3f}".format("data loading", load_time))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Render all figures from one load of data")
+
+    arg_parser.add_argument("figures", nargs="*", help="Figures to render (default all): " + ", ".join(FIGURES))
+    arg_parser.add_argument("--folder", default="data", help="Folder with downloaded data")
+    arg_parser.add_argument("--output", default="report", help="Folder for figures")
+    arg_parser.add_argument("--workers", type=int, help="Count of rendering processes")
+    arg_parser.add_argument("--cube", help="Folder with cached monthly cube (created when missing)")
+    instrument.add_argument(arg_parser)
+
+    args = arg_parser.parse_args()
+    # workers of pool get configuration from environment
+    instrument.configure_from_args(args)
+
+    unknown = [name for name in args.figures if name not in FIGURES]
+    if unknown:
+        arg_parser.error("unknown figures: " + ", ".join(unknown))
+
+    start = time.perf_counter()
+    load_time, timings = run_report(args.figures or list(FIGURES), args.folder, args.output,
+                                    args.workers, args.cube)
+
+    print_timings(load_time, timings)
+    print("{:<20}{:>16.3f}".format("total", time.perf_counter() - start))